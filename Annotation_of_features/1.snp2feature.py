@@ -1,56 +1,44 @@
+import csv
+import numpy as np
 import pandas as pd
-import subprocess
 from argparse import ArgumentParser
+from gff_index import load_index
+from gff_table import attribute_values
 
-def parse_attributes(attr_string):
-    """Parse GFF attributes into a dictionary"""
-    attrs = {}
-    for item in attr_string.split(';'):
-        if '=' in item:
-            key, value = item.split('=', 1)
-            attrs[key] = value
-    return attrs
+def features_in_regions(regions, index):
+    """GFF features overlapping the regions, in GFF order.
 
-def parse_gff_line(line):
-    """Parse a GFF line with extracted feature names and IDs"""
-    if line.startswith('#'):
-        return None
-    
-    fields = line.strip().split('\t')
-    if len(fields) < 9:
-        return None
-    
-    # Parse attributes
-    attrs = parse_attributes(fields[8])
-    
-    # Extract gene name and ID
-    gene_name = attrs.get('Name', '')
-    gene_id = attrs.get('Dbxref', '').split(',')[0] if 'Dbxref' in attrs else ''
-    
-    return {
-        'chr': fields[0],
-        'start': fields[3],
-        'end': fields[4],
-        'feature_type': fields[2],
-        'feature_source': fields[1],
-        'feature_strand': fields[6],
-        'feature_score': fields[5],
-        'feature_phase': fields[7],
-        'feature_name': gene_name,
-        'feature_id': gene_id,
-        'full_attributes': fields[8]
-    }
+    Regions are BED-style (0-based, end exclusive). As with bedtools
+    intersect -wa, a feature is reported once for every region it overlaps.
+    """
+    region, feature = index.overlaps(regions['CHR'], regions['START'], regions['END'])
+    feature = feature[np.lexsort((region, feature))]
+    table = index.features(feature)
 
-def convert_to_bed(df, output_file):
-    """Convert annotation dataframe to BED format"""
-    bed_df = df[['CHR', 'START', 'END']]
-    bed_df.to_csv(output_file, sep='\t', header=False, index=False)
+    # Extract gene name and ID; GTF files carry them as gene_name and gene_id
+    gtf = index.meta['syntax'] == 'gtf'
+    names = attribute_values(table['attributes'], 'gene_name' if gtf else 'Name', index.meta['syntax'])
+    ids = attribute_values(table['attributes'], 'gene_id' if gtf else 'Dbxref', index.meta['syntax'])
+    return pd.DataFrame({
+        'chr': table['seqid'],
+        'start': table['start'],
+        'end': table['end'],
+        'feature_type': table['type'],
+        'feature_name': names,
+        'feature_id': ids.str.split(',').str[0],
+        'feature_source': table['source'],
+        'feature_strand': table['strand'],
+        'feature_score': table['score'],
+        'feature_phase': table['phase'],
+        'full_attributes': table['attributes']
+    })
 
 def main():
-    parser = ArgumentParser(description='Find genomic features in regions using bedtools')
+    parser = ArgumentParser(description='Find genomic features in regions')
     parser.add_argument('--anno', required=True, help='Input annotation file (CHR, START, END)')
-    parser.add_argument('--gff', required=True, help='Reference GFF file')
+    parser.add_argument('--gff', required=True, help='Reference GFF or GTF file (may be gzip/bgzip compressed)')
     parser.add_argument('--output', required=True, help='Output file name')
+    parser.add_argument('--index', default=None, help='Feature index directory (default: <gff>.idx, built on first use)')
     
     args = parser.parse_args()
     
@@ -58,44 +46,18 @@ def main():
     print("Reading regions file...")
     regions = pd.read_csv(args.anno, sep='\t')
     
-    # Convert regions to BED format
-    convert_to_bed(regions, "regions.bed")
-    
-    # Run bedtools intersect
-    print("\nRunning bedtools intersect...")
-    cmd = f"bedtools intersect -a {args.gff} -b regions.bed -wa"
-    
-    try:
-        result = subprocess.run(cmd, shell=True, check=True, capture_output=True, text=True)
-        intersections = result.stdout.strip().split('\n')
-        
-        results = []
-        for line in intersections:
-            if line:
-                gff_fields = parse_gff_line(line)
-                if gff_fields:
-                    results.append(gff_fields)
-        
-        # Create output dataframe
-        results_df = pd.DataFrame(results)
-        if not results_df.empty:
-            # Reorder columns to put feature_name and feature_id more prominently
-            cols = ['chr', 'start', 'end', 'feature_type', 'feature_name', 'feature_id', 
-                   'feature_source', 'feature_strand', 'feature_score', 'feature_phase', 
-                   'full_attributes']
-            results_df = results_df[cols]
-            
-            results_df.to_csv(args.output, sep='\t', index=False)
-            print(f"\nResults written to {args.output}")
-            print(f"Found {len(results_df)} intersecting features")
-        else:
-            print("\nNo intersecting features found")
-            
-    except subprocess.CalledProcessError as e:
-        print(f"Error running bedtools: {e}")
-        
-    # Cleanup
-    subprocess.run("rm regions.bed", shell=True)
+    # Find overlapping features
+    print("\nSearching feature index...")
+    index = load_index(args.gff, args.index)
+    results_df = features_in_regions(regions, index)
+
+    if not results_df.empty:
+        # GTF attribute quotes are written as they are
+        results_df.to_csv(args.output, sep='\t', index=False, quoting=csv.QUOTE_NONE)
+        print(f"\nResults written to {args.output}")
+        print(f"Found {len(results_df)} intersecting features")
+    else:
+        print("\nNo intersecting features found")
 
 if __name__ == "__main__":
     main()
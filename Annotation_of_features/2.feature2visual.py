@@ -1,16 +1,30 @@
-import subprocess
+import os
 import pandas as pd
 import matplotlib.pyplot as plt
 from pathlib import Path
 import argparse
 import sys
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from gff_index import GffIndex, load_index
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GWAS'))
+from gwas_batch import read_manifest, scan_directory
+
+# Region files picked up from a --batch directory
+REGION_EXTENSIONS = ('.txt', '.tsv', '.bed')
+REGION_COLUMNS = {'CHR', 'START', 'END'}
 
 class RegionAnnotator:
-    def __init__(self, input_file, gff_file, output_prefix, trait_name):
-        """Initialize the region annotator with input files, output prefix and trait name."""
+    def __init__(self, input_file, gff_file, output_prefix, trait_name, index_path=None, index=None):
+        """Initialize the region annotator with input files, output prefix and trait name.
+
+        An already opened GffIndex can be passed to share it between annotators.
+        """
         self.input_file = input_file
         self.gff_file = gff_file
+        self.index_path = index_path
+        self.index = index
         self.output_prefix = output_prefix
         self.trait_name = trait_name
         self.intersect_results = None
@@ -27,60 +41,31 @@ class RegionAnnotator:
             print(f"Error reading input file: {e}")
             return None
 
-    def create_bed(self, regions_df):
-        """Create BED format file from input regions."""
-        bed_file = f"{self.output_prefix}.bed"
-        bed_df = regions_df.copy()
-        bed_df['name'] = bed_df.apply(lambda x: f"{x['CHR']}_{x['START']}_{x['END']}", axis=1)
-        bed_df[['CHR', 'START', 'END', 'name']].to_csv(
-            bed_file, sep='\t', header=False, index=False
-        )
-        return bed_file
-
-    def run_bedtools_intersection(self):
-        """Run bedtools to intersect regions with GFF features."""
+    def run_intersection(self):
+        """Intersect regions with GFF features using the feature index."""
         try:
             regions_df = self.read_input_regions()
             if regions_df is None:
                 return False
 
-            bed_file = self.create_bed(regions_df)
-            
-            cmd = [
-                'bedtools', 'intersect',
-                '-a', bed_file,
-                '-b', self.gff_file,
-                '-wa', '-wb'
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            intersections = []
-            for line in result.stdout.strip().split('\n'):
-                if line:
-                    fields = line.split('\t')
-                    if len(fields) >= 12:
-                        intersection = {
-                            'region_chr': fields[0],
-                            'region_start': int(fields[1]),
-                            'region_end': int(fields[2]),
-                            'feature_chr': fields[4],
-                            'feature_source': fields[5],
-                            'feature_type': fields[6],
-                            'feature_start': int(fields[7]),
-                            'feature_end': int(fields[8]),
-                            'feature_strand': fields[9],
-                            'feature_attributes': fields[11]
-                        }
-                        intersections.append(intersection)
-            
-            self.intersect_results = pd.DataFrame(intersections)
+            index = self.index or load_index(self.gff_file, self.index_path)
+            region, feature = index.overlaps(regions_df['CHR'], regions_df['START'], regions_df['END'])
+            features = index.features(feature)
+
+            self.intersect_results = pd.DataFrame({
+                'region_chr': regions_df['CHR'].to_numpy()[region].astype(str),
+                'region_start': regions_df['START'].to_numpy()[region].astype(int),
+                'region_end': regions_df['END'].to_numpy()[region].astype(int),
+                'feature_chr': features['seqid'],
+                'feature_source': features['source'],
+                'feature_type': features['type'],
+                'feature_start': features['start'],
+                'feature_end': features['end'],
+                'feature_strand': features['strand'],
+                'feature_attributes': features['attributes']
+            })
             return True
-            
-        except subprocess.CalledProcessError as e:
-            print(f"Error running bedtools: {e}")
-            print(f"stderr: {e.stderr}")
-            return False
+
         except Exception as e:
             print(f"Error processing intersection: {e}")
             return False
@@ -142,21 +127,121 @@ class RegionAnnotator:
                     dpi=dpi, bbox_inches='tight')
         plt.close()
 
+def has_region_header(filepath):
+    """True if the first line of a file is a tab-separated header with CHR, START and END."""
+    try:
+        with open(filepath) as f:
+            return REGION_COLUMNS.issubset(f.readline().rstrip('\n').split('\t'))
+    except (OSError, UnicodeDecodeError):
+        return False
+
+def region_traits(source):
+    """Traits of a --batch directory or manifest whose files have a region header; others are skipped."""
+    traits = scan_directory(source, REGION_EXTENSIONS) if os.path.isdir(source) else read_manifest(source)
+    valid = np.array([has_region_header(f) for f in traits['file']], dtype=bool)
+    for f in traits['file'][~valid]:
+        print(f"Skipping {f}: no CHR, START and END header")
+    return traits[valid].reset_index(drop=True)
+
+_worker = {}
+
+def init_worker(index_path):
+    """Process pool initializer: open the shared, memory-mapped feature index once per worker."""
+    import matplotlib
+    matplotlib.use('Agg')
+    _worker['index'] = GffIndex(index_path)
+
+def annotate_trait(filepath, trait, gff_file, output_dir, dpi):
+    """Annotate and plot one trait's regions; returns its status and feature type counts."""
+    prefix = os.path.join(output_dir, trait)
+    annotator = RegionAnnotator(filepath, gff_file, prefix, trait, index=_worker['index'])
+    if not annotator.run_intersection():
+        return {'trait': trait, 'status': 'error', 'counts': {}}
+    annotator.create_summary_plots(dpi=dpi)
+    counts = annotator.intersect_results['feature_type'].value_counts().to_dict() \
+        if not annotator.intersect_results.empty else {}
+    return {'trait': trait, 'status': 'ok', 'counts': counts}
+
+def plot_feature_matrix(matrix, output_file, dpi=600):
+    """Heatmap of feature counts per trait (rows) and feature type (columns)."""
+    fig, ax = plt.subplots(figsize=(max(6, 0.6 * matrix.shape[1] + 3), max(4, 0.35 * matrix.shape[0] + 2)))
+    image = ax.imshow(matrix.to_numpy(), aspect='auto', cmap='viridis')
+    ax.set_xticks(np.arange(matrix.shape[1]))
+    ax.set_xticklabels(matrix.columns, rotation=45, ha='right')
+    ax.set_yticks(np.arange(matrix.shape[0]))
+    ax.set_yticklabels(matrix.index)
+    ax.set_xlabel('Feature Type', size=10)
+    ax.set_ylabel('Trait', size=10)
+    ax.grid(False)
+    fig.colorbar(image, ax=ax, label='Number of Features')
+    ax.set_title('Feature Types Across Traits', pad=20, size=12)
+    fig.savefig(output_file, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+
+def run_batch(args):
+    """Annotate every trait of a manifest or directory against one shared feature index."""
+    traits = region_traits(args.batch)
+    if traits.empty:
+        print("No region files found!")
+        sys.exit(1)
+    duplicated = traits['trait'][traits['trait'].duplicated()].unique()
+    if len(duplicated):
+        print(f"Error: duplicated trait names: {', '.join(duplicated)}")
+        sys.exit(1)
+    os.makedirs(args.output, exist_ok=True)
+
+    # Build or validate the index once; workers only map it
+    index = load_index(args.gff, args.index)
+    print(f"Annotating {len(traits)} traits with {args.workers} workers")
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(index.path,)) as pool:
+        futures = [pool.submit(annotate_trait, row.file, row.trait, args.gff, args.output, args.dpi)
+                   for row in traits.itertuples()]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{len(results)}/{len(traits)}] {result['trait']}: {result['status']}")
+
+    # Trait x feature type matrix of the annotated traits, in manifest order
+    done = {r['trait']: r['counts'] for r in results if r['status'] == 'ok'}
+    matrix = pd.DataFrame({trait: pd.Series(counts, dtype=float) for trait, counts in done.items()}).T
+    matrix = matrix.reindex([t for t in traits['trait'] if t in done]).fillna(0).astype(int)
+    matrix = matrix[matrix.sum().sort_values(ascending=False).index]
+    matrix.index.name = 'trait'
+    matrix_file = os.path.join(args.output, 'feature_type_matrix.txt')
+    matrix.to_csv(matrix_file, sep='\t')
+    if matrix.shape[1]:
+        plot_feature_matrix(matrix, os.path.join(args.output, 'feature_type_matrix.png'), dpi=args.dpi)
+    failed = [r['trait'] for r in results if r['status'] != 'ok']
+    if failed:
+        print(f"Failed traits: {', '.join(failed)}")
+    print(f"\nTrait x feature type matrix saved to: {matrix_file}")
+
 def main():
     parser = argparse.ArgumentParser(description='Region Feature Annotation Tool')
-    parser.add_argument('--input', required=True, help='Input regions file (CHR, START, END)')
-    parser.add_argument('--gff', required=True, help='Reference GFF file')
-    parser.add_argument('--output', required=True, help='Output prefix')
-    parser.add_argument('--trait', required=True, help='Name of the trait being analyzed')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='Input regions file (CHR, START, END)')
+    source.add_argument('--batch', help='Directory of region files or a manifest (file<TAB>trait)')
+    parser.add_argument('--gff', required=True, help='Reference GFF or GTF file (may be gzip/bgzip compressed)')
+    parser.add_argument('--output', required=True, help='Output prefix (output directory with --batch)')
+    parser.add_argument('--trait', help='Name of the trait being analyzed')
     parser.add_argument('--dpi', type=int, default=600, help='DPI for plots')
+    parser.add_argument('--index', default=None, help='Feature index directory (default: <gff>.idx, built on first use)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes with --batch')
     
     args = parser.parse_args()
+    if args.batch:
+        run_batch(args)
+        return
+    if not args.trait:
+        parser.error('--trait is required with --input')
     
-    annotator = RegionAnnotator(args.input, args.gff, args.output, args.trait)
+    annotator = RegionAnnotator(args.input, args.gff, args.output, args.trait, args.index)
     
     # Run intersection
-    print("Running bedtools intersection...")
-    if not annotator.run_bedtools_intersection():
+    print("Running feature intersection...")
+    if not annotator.run_intersection():
         sys.exit(1)
     
     # Create visualizations
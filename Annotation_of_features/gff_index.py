@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from gff_table import GFF_COLUMNS, CATEGORICAL, iter_gff_chunks, attribute_syntax, attribute_values
+
+# Chromosomes are laid end to end on one axis, each in its own 2^40 bp slot
+CHROM_SHIFT = 40
+
+
+def gff_signature(gff_file: str) -> dict:
+    """Path, size and modification time identifying the GFF an index was built from."""
+    stat = os.stat(gff_file)
+    return {'gff': os.path.abspath(gff_file), 'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+
+def length_buckets(length: np.ndarray) -> np.ndarray:
+    """Bucket k holds features of length at most 2^k, so each bucket has a tight maximum length."""
+    return np.ceil(np.log2(np.maximum(length, 1))).astype(np.int64)
+
+
+class GffIndex:
+    """Interval index over GFF features, stored as a directory of .npy arrays and an attribute byte file.
+
+    Features are grouped into buckets of similar length and sorted by
+    (chromosome, start) within each bucket. A query window only has to reach
+    back by the longest feature of the bucket, so overlaps of many regions are
+    found with a few searchsorted calls per bucket. All arrays are memory-mapped,
+    so processes sharing an index share its pages.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.categories = self.meta['categories']
+        self.n_features = self.meta['n_features']
+
+    def _array(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+
+    @classmethod
+    def build(cls, gff_file: str, path: str, chunksize: int = 500_000) -> 'GffIndex':
+        """Stream a GFF or GTF once and write its index to the directory path.
+
+        Attribute strings are appended to a byte file as chunks arrive, so only
+        the coordinate and category code columns are held in memory.
+        """
+        os.makedirs(path, exist_ok=True)
+        categories = {column: pd.Index([], dtype=object) for column in CATEGORICAL}
+        columns = {column: [] for column in CATEGORICAL + ['start', 'end']}
+        lengths = []
+        syntax = None
+        with open(os.path.join(path, 'attributes.bin'), 'wb') as attributes:
+            for chunk in iter_gff_chunks(gff_file, chunksize):
+                for column in CATEGORICAL:
+                    values = chunk[column].cat.categories
+                    categories[column] = categories[column].append(values.difference(categories[column]))
+                    columns[column].append(categories[column].get_indexer(chunk[column]).astype(np.int32))
+                columns['start'].append(chunk['start'].to_numpy())
+                columns['end'].append(chunk['end'].to_numpy())
+                syntax = syntax or attribute_syntax(chunk['attributes'])
+                encoded = chunk['attributes'].str.encode('utf-8')
+                attributes.write(b''.join(encoded))
+                lengths.append(encoded.str.len().to_numpy())
+
+        for column, parts in columns.items():
+            dtype = np.int64 if column in ('start', 'end') else np.int32
+            np.save(os.path.join(path, f'{column}.npy'), np.concatenate(parts) if parts else np.zeros(0, dtype))
+        offsets = np.zeros(sum(len(part) for part in lengths) + 1, dtype=np.int64)
+        if lengths:
+            np.cumsum(np.concatenate(lengths), out=offsets[1:])
+        np.save(os.path.join(path, 'attribute_offsets.npy'), offsets)
+
+        # Half-open 0-based intervals on the shifted axis, sorted by bucket then start
+        chrom = np.load(os.path.join(path, 'seqid.npy')).astype(np.int64) << CHROM_SHIFT
+        start = chrom + np.load(os.path.join(path, 'start.npy')) - 1
+        end = chrom + np.load(os.path.join(path, 'end.npy'))
+        bucket = length_buckets(end - start)
+        order = np.lexsort((start, bucket))
+        bounds = np.searchsorted(bucket[order], np.arange(bucket.max() + 2 if len(bucket) else 1))
+        max_length = np.array([(end - start)[order[a:b]].max() if b > a else 0
+                               for a, b in zip(bounds[:-1], bounds[1:])], dtype=np.int64)
+        np.save(os.path.join(path, 'order.npy'), order)
+        np.save(os.path.join(path, 'sorted_start.npy'), start[order])
+        np.save(os.path.join(path, 'sorted_end.npy'), end[order])
+        np.save(os.path.join(path, 'bucket_bounds.npy'), bounds)
+        np.save(os.path.join(path, 'bucket_max_length.npy'), max_length)
+
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(dict(gff_signature(gff_file), n_features=len(offsets) - 1, syntax=syntax or 'gff3',
+                           categories={column: [str(c) for c in values] for column, values in categories.items()}), f)
+        return cls(path)
+
+    def overlaps(self, chrom, start, end):
+        """Features overlapping half-open 0-based (BED) regions.
+
+        Returns (region, feature) index arrays, one entry per overlapping pair,
+        ordered by region and then by feature position in the GFF.
+        """
+        codes = pd.Index(self.categories['seqid']).get_indexer(pd.Series(chrom).astype(str))
+        known = np.nonzero(codes >= 0)[0]
+        shift = codes[known].astype(np.int64) << CHROM_SHIFT
+        q_start = shift + np.asarray(start, dtype=np.int64)[known]
+        q_end = shift + np.asarray(end, dtype=np.int64)[known]
+
+        sorted_start, sorted_end = self._array('sorted_start'), self._array('sorted_end')
+        order, bounds = self._array('order'), self._array('bucket_bounds')
+        regions, features = [], []
+        for b, max_length in enumerate(self._array('bucket_max_length')):
+            a, z = bounds[b], bounds[b + 1]
+            if z == a:
+                continue
+            starts = sorted_start[a:z]
+            # Candidates start before the region ends and no more than max_length before it starts
+            lo = np.searchsorted(starts, q_start - max_length + 1)
+            hi = np.searchsorted(starts, q_end)
+            counts = np.maximum(hi - lo, 0)
+            total = counts.sum()
+            if total == 0:
+                continue
+            region = np.repeat(np.arange(len(known)), counts)
+            first = np.repeat(lo - np.cumsum(counts) + counts, counts)
+            candidate = a + first + np.arange(total)
+            hit = sorted_end[candidate] > q_start[region]
+            regions.append(known[region[hit]])
+            features.append(order[candidate[hit]])
+        if not regions:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        regions, features = np.concatenate(regions), np.concatenate(features)
+        by_region = np.lexsort((features, regions))
+        return regions[by_region], features[by_region]
+
+    def attributes(self, rows) -> pd.Series:
+        """Raw attribute strings of the given feature rows."""
+        data = np.memmap(os.path.join(self.path, 'attributes.bin'), dtype=np.uint8, mode='r') \
+            if self.n_features else np.zeros(0, dtype=np.uint8)
+        offsets = self._array('attribute_offsets')
+        rows = np.asarray(rows, dtype=np.int64)
+        return pd.Series([bytes(data[offsets[r]:offsets[r + 1]]).decode('utf-8') for r in rows],
+                         dtype=object)
+
+    def attribute(self, rows, key: str) -> pd.Series:
+        """Value of one attribute key for the given feature rows ('' where absent)."""
+        return attribute_values(self.attributes(rows), key, self.meta['syntax'])
+
+    def features(self, rows) -> pd.DataFrame:
+        """GFF columns of the given feature rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        table = pd.DataFrame({column: np.asarray(self.categories[column], dtype=object)[self._array(column)[rows]]
+                              for column in CATEGORICAL})
+        table['start'] = self._array('start')[rows]
+        table['end'] = self._array('end')[rows]
+        table['attributes'] = self.attributes(rows)
+        return table[GFF_COLUMNS]
+
+
+def index_path(gff_file: str) -> str:
+    """Default index directory: next to the GFF file."""
+    return f"{gff_file}.idx"
+
+
+def load_index(gff_file: str, path: str = None, rebuild: bool = False) -> GffIndex:
+    """Open the index of a GFF file, building it when missing or out of date."""
+    path = path or index_path(gff_file)
+    meta_file = os.path.join(path, 'meta.json')
+    if not rebuild and os.path.exists(meta_file):
+        index = GffIndex(path)
+        if all(index.meta.get(key) == value for key, value in gff_signature(gff_file).items()):
+            return index
+    print(f"Building feature index {path} ...")
+    return GffIndex.build(gff_file, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the interval index of a GFF/GTF file')
+    parser.add_argument('--gff', required=True, help='Reference GFF or GTF file (may be gzip/bgzip compressed)')
+    parser.add_argument('--index', default=None, help='Index directory (default: <gff>.idx)')
+    args = parser.parse_args()
+
+    index = load_index(args.gff, args.index, rebuild=True)
+    print(f"Indexed {index.n_features} features on {len(index.categories['seqid'])} sequences in {index.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import re
+import csv
+import gzip
+import argparse
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+GFF_COLUMNS = ['seqid', 'source', 'type', 'start', 'end', 'score', 'strand', 'phase', 'attributes']
+
+# Low-cardinality text columns kept as pandas categoricals
+CATEGORICAL = ['seqid', 'source', 'type', 'score', 'strand', 'phase']
+
+
+def open_text(path: str):
+    """Open a plain, gzip or bgzip (multi-member gzip) file for reading text."""
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rt')
+    return open(path)
+
+
+def iter_gff_chunks(path: str, chunksize: int = 500_000):
+    """Stream a GFF3 or GTF file as DataFrames of at most chunksize features.
+
+    Coordinates are int64 and the text columns in CATEGORICAL are categoricals;
+    attributes stay unparsed strings. Comment and directive lines, and the
+    sequences of a ##FASTA section, have no ninth column and are dropped.
+    """
+    with open_text(path) as f:
+        reader = pd.read_csv(f, sep='\t', header=None, names=GFF_COLUMNS, dtype=str,
+                             quoting=csv.QUOTE_NONE, chunksize=chunksize, on_bad_lines='skip')
+        for chunk in reader:
+            chunk = chunk[chunk['attributes'].notna() & ~chunk['seqid'].str.startswith('#', na=True)]
+            if chunk.empty:
+                continue
+            chunk = chunk.astype({'start': np.int64, 'end': np.int64})
+            chunk = chunk.astype({column: 'category' for column in CATEGORICAL})
+            yield chunk.reset_index(drop=True)
+
+
+def read_gff(path: str, chunksize: int = 500_000) -> pd.DataFrame:
+    """Read a whole GFF3 or GTF file into one columnar DataFrame."""
+    chunks = list(iter_gff_chunks(path, chunksize))
+    if not chunks:
+        return pd.DataFrame(columns=GFF_COLUMNS)
+    table = pd.DataFrame({column: union_categoricals([c[column] for c in chunks])
+                          if column in CATEGORICAL else np.concatenate([c[column].to_numpy() for c in chunks])
+                          for column in GFF_COLUMNS})
+    return table
+
+
+def attribute_syntax(attributes: pd.Series, sample: int = 1000) -> str:
+    """'gtf' for key "value"; attributes, 'gff3' for key=value;key=value."""
+    head = attributes.iloc[:sample].astype(str)
+    gtf = head.str.match(r'^\s*[^\s=;]+\s+"').sum()
+    return 'gtf' if gtf > len(head) / 2 else 'gff3'
+
+
+def attribute_values(attributes: pd.Series, key: str, syntax: str = None) -> pd.Series:
+    """Value of one attribute key for every row, '' where the key is absent.
+
+    Only the requested key is extracted, with one vectorized regular
+    expression over the column; no per-row attribute dictionary is built.
+    """
+    attributes = pd.Series(attributes, dtype=object).reset_index(drop=True)
+    if attributes.empty:
+        return pd.Series([], dtype=object)
+    syntax = syntax or attribute_syntax(attributes)
+    if syntax == 'gtf':
+        pattern = r'(?:^|;)\s*' + re.escape(key) + r'\s+"?([^";]*)"?'
+    else:
+        pattern = r'(?:^|;)' + re.escape(key) + r'=([^;]*)'
+    return attributes.str.extract(pattern, expand=False).fillna('').astype(object)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a GFF3/GTF annotation file')
+    parser.add_argument('--gff', required=True, help='GFF3 or GTF file (may be gzip/bgzip compressed)')
+    args = parser.parse_args()
+
+    table = read_gff(args.gff)
+    print(f"{len(table)} features on {table['seqid'].nunique()} sequences "
+          f"({attribute_syntax(table['attributes'])} attributes)")
+    print(table['type'].value_counts().to_string())
+
+
+if __name__ == "__main__":
+    main()
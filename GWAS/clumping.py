@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Genetic_data_management'))
+from plink_bed import PlinkBed
+
+LOCUS_COLUMNS = ['CHR', 'START', 'END', 'LEAD_SNP', 'LEAD_BP', 'LEAD_P', 'N_SNPS']
+
+
+def _locus_table(snps: pd.DataFrame, locus_id: np.ndarray) -> pd.DataFrame:
+    """Summarise SNPs grouped by locus id into one lead-SNP row per locus.
+
+    START and END are 0-based, end-exclusive (BED) coordinates covering the
+    locus SNPs, as read by the annotation tools.
+    """
+    snps = snps.assign(locus=locus_id)
+    lead = snps.loc[snps.groupby('locus')['p'].idxmin()].set_index('locus')
+    bounds = snps.groupby('locus')['bp'].agg(['min', 'max', 'size'])
+    chrom = lead['Chr']
+    # Chromosomes coerced to float (1.0) are written as integers to match GFF seqids
+    if pd.api.types.is_float_dtype(chrom) and (chrom == np.floor(chrom)).all():
+        chrom = chrom.astype(np.int64)
+    loci = pd.DataFrame({
+        'CHR': chrom,
+        'START': bounds['min'] - 1,
+        'END': bounds['max'],
+        'LEAD_SNP': lead['SNP'],
+        'LEAD_BP': lead['bp'],
+        'LEAD_P': lead['p'],
+        'N_SNPS': bounds['size'],
+    })
+    return loci.sort_values(['CHR', 'START']).reset_index(drop=True)
+
+
+def clump_by_distance(snps: pd.DataFrame, window_kb: float = 500) -> pd.DataFrame:
+    """Merge significant SNPs closer than window_kb into loci.
+
+    SNPs are sorted by (Chr, bp) once and swept in order: a new locus starts at
+    every chromosome change or gap larger than the window.
+    """
+    snps = snps[snps['Chr'].notna()].sort_values(['Chr', 'bp'])
+    if snps.empty:
+        return pd.DataFrame(columns=LOCUS_COLUMNS)
+    chrom = snps['Chr'].to_numpy()
+    bp = snps['bp'].to_numpy()
+    new_locus = np.ones(len(snps), dtype=bool)
+    new_locus[1:] = (chrom[1:] != chrom[:-1]) | (np.diff(bp) > window_kb * 1000)
+    return _locus_table(snps, np.cumsum(new_locus))
+
+
+def read_bed_snps(bfile: str, snp_ids) -> tuple:
+    """Read genotypes (0/1/2 copies of A1, NaN missing) for selected SNPs of a PLINK fileset.
+
+    Returns (genotypes, found_ids) where genotypes is samples x SNPs.
+    """
+    g, found_ids = PlinkBed(bfile).read_snps(snp_ids)
+    genotypes = g.T.astype(np.float32)
+    genotypes[genotypes < 0] = np.nan
+    return genotypes, found_ids
+
+
+def _standardize(genotypes: np.ndarray) -> np.ndarray:
+    """Centre and scale genotype columns, with missing values set to the mean (0)."""
+    mean = np.nanmean(genotypes, axis=0)
+    z = genotypes - mean
+    z[np.isnan(z)] = 0
+    sd = np.sqrt((z ** 2).mean(axis=0))
+    sd[sd == 0] = 1
+    return z / sd
+
+
+def clump_by_ld(snps: pd.DataFrame, bfile: str, window_kb: float = 500,
+                r2_threshold: float = 0.2) -> pd.DataFrame:
+    """PLINK-style greedy clumping using LD from a reference genotype set.
+
+    The most significant unassigned SNP becomes a lead and claims every
+    unassigned SNP on its chromosome within window_kb with r² above the
+    threshold. SNPs absent from the reference can only form their own locus.
+    """
+    snps = snps[snps['Chr'].notna()].sort_values('p').reset_index(drop=True)
+    if snps.empty:
+        return pd.DataFrame(columns=LOCUS_COLUMNS)
+
+    genotypes, found_ids = read_bed_snps(bfile, snps['SNP'].astype(str))
+    missing = len(snps['SNP'].unique()) - len(found_ids)
+    if missing:
+        print(f"Warning: {missing} SNPs not found in {bfile}.bim; they are not clumped with others")
+    z = _standardize(genotypes)
+    column = pd.Index(found_ids).get_indexer(snps['SNP'].astype(str))
+
+    chrom = snps['Chr'].to_numpy()
+    bp = snps['bp'].to_numpy()
+    locus_id = np.full(len(snps), -1, dtype=np.int64)
+    n_samples = z.shape[0]
+    for lead in range(len(snps)):
+        if locus_id[lead] >= 0:
+            continue
+        locus_id[lead] = lead
+        if column[lead] < 0:
+            continue
+        nearby = np.nonzero((locus_id < 0) & (chrom == chrom[lead]) &
+                            (np.abs(bp - bp[lead]) <= window_kb * 1000) & (column >= 0))[0]
+        if len(nearby):
+            r = z[:, column[nearby]].T @ z[:, column[lead]] / n_samples
+            locus_id[nearby[r ** 2 >= r2_threshold]] = lead
+    return _locus_table(snps, locus_id)
+
+
+def clump(snps: pd.DataFrame, window_kb: float = 500, bfile: str = None,
+          r2_threshold: float = 0.2) -> pd.DataFrame:
+    """Group significant SNPs into loci, by LD when a reference fileset is given."""
+    if bfile:
+        if not os.path.exists(f"{bfile}.bed"):
+            raise FileNotFoundError(f"Reference genotypes not found: {bfile}.bed")
+        return clump_by_ld(snps, bfile, window_kb, r2_threshold)
+    return clump_by_distance(snps, window_kb)
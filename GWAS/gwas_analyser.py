@@ -1,43 +1,57 @@
 import pandas as pd
 import numpy as np
-from scipy import stats
 import matplotlib.pyplot as plt
 import seaborn as sns
 from typing import Tuple, List
 import argparse
 import sys
+from mlma_stream import stream_mlma
+from mlma_cache import load_mlma
+from gwas_plots import draw_manhattan, draw_qq, qq_thin_ranks
+import lambda_engine
+from clumping import clump
 
 class GWASAnalyzer:
-    def __init__(self, filepath: str = None, n_snps: int = None):
-        """Initialize GWAS analyzer with input file path and number of SNPs."""
+    def __init__(self, filepath: str = None, n_snps: int = None, stream: bool = False,
+                 chunksize: int = 1_000_000, top_k: int = 10_000, use_cache: bool = True,
+                 trait_name: str = None):
+        """Initialize GWAS analyzer with input file path and number of SNPs.
+
+        With stream=True the file is read in chunks and only the top_k SNPs
+        (plus all SNPs with p < 1e-4) are kept in memory. Otherwise the parsed
+        columns are cached next to the input so later runs skip text parsing.
+        The trait name is prompted for only when it is not given.
+        """
         if filepath is None:
             filepath = input("Enter the name of your .mlma file (with extension): ")
         
-        self.trait_name = input("Enter the trait name: ")
-        self.data = self.read_gwas_data(filepath)
-        self.n_snps = n_snps if n_snps else len(self.data)
+        self.trait_name = trait_name if trait_name else input("Enter the trait name: ")
         self.lambda_gc = None
+        self.stream_result = None
+        self.sorted_logp = None
         
         # Standard GWAS thresholds
         self.significant_threshold = 5e-8
         self.suggestive_threshold = 1e-5
         
+        if stream:
+            self.data = self.stream_gwas_data(filepath, chunksize, top_k)
+            self.n_snps = n_snps if n_snps else self.stream_result.n_snps
+        else:
+            self.data = self.read_gwas_data(filepath, use_cache)
+            self.n_snps = n_snps if n_snps else len(self.data)
+        
         # Calculate genomic inflation factor
         self.calculate_lambda()
+        print(f"\nλ = {self.lambda_gc:.3f}; "
+              f"{self.count_below(self.significant_threshold)} SNPs below {self.significant_threshold:g}, "
+              f"{self.count_below(self.suggestive_threshold)} below {self.suggestive_threshold:g}")
 
-    def read_gwas_data(self, filepath: str) -> pd.DataFrame:
+    def read_gwas_data(self, filepath: str, use_cache: bool = True) -> pd.DataFrame:
         """Read and validate GCTA MLMA format results file."""
         try:
-            # Read MLMA file
-            df = pd.read_csv(filepath, delim_whitespace=True)
-            
-            # Check required columns
-            required_columns = {'Chr', 'SNP', 'bp', 'A1', 'A2', 'Freq', 'b', 'se', 'p'}
-            if not required_columns.issubset(df.columns):
-                raise ValueError(f"Missing required columns. Required: {required_columns}")
-            
-            # Handle chromosome naming
-            df['Chr'] = pd.to_numeric(df['Chr'], errors='coerce')
+            # Read MLMA file (through the column cache unless disabled)
+            df = load_mlma(filepath, use_cache=use_cache)
             
             # Convert p-values to -log10
             df['-log10p'] = -np.log10(df['p'])
@@ -46,6 +60,9 @@ class GWASAnalyzer:
             sorted_file = filepath.replace(".mlma", "_sorted_results.txt")
             df_sorted = df.sort_values('p')
             df_sorted.to_csv(sorted_file, sep='\t', index=False)
+            
+            # Keep one sorted -log10(p) buffer for lambda, thresholds and Q-Q
+            self.sorted_logp = df_sorted['-log10p'].to_numpy(dtype=np.float32)
             print(f"\nRead {len(df)} SNPs from {filepath}")
             print(f"Sorted results saved to: {sorted_file}")
             
@@ -59,47 +76,87 @@ class GWASAnalyzer:
             print(f"Error reading GWAS data: {e}")
             raise
 
+    def stream_gwas_data(self, filepath: str, chunksize: int, top_k: int) -> pd.DataFrame:
+        """Read MLMA results in chunks, keeping only the top SNPs in memory."""
+        try:
+            self.stream_result = stream_mlma(filepath, chunksize=chunksize, top_k=top_k,
+                                             exact_threshold=self.suggestive_threshold)
+            df_top = self.stream_result.top_snps
+            
+            # Only the retained SNPs can be written in sorted order
+            top_file = filepath.replace(".mlma", "_top_results.txt")
+            df_top.to_csv(top_file, sep='\t', index=False)
+            print(f"\nStreamed {self.stream_result.n_snps} SNPs from {filepath}")
+            print(f"Top {len(df_top)} SNPs saved to: {top_file}")
+            
+            print("\nTop 10 most significant SNPs:")
+            print(df_top[['Chr', 'SNP', 'p', '-log10p', 'Freq', 'b']].head(10).to_string())
+            
+            return df_top
+            
+        except Exception as e:
+            print(f"Error reading GWAS data: {e}")
+            raise
+
     def calculate_lambda(self) -> float:
         """Calculate genomic inflation factor (λ)."""
-        observed_chi2 = stats.chi2.ppf(1 - self.data['p'], 1)
-        median_chi2 = np.median(observed_chi2)
-        self.lambda_gc = median_chi2 / stats.chi2.ppf(0.5, 1)
+        if self.stream_result is not None:
+            self.lambda_gc = self.stream_result.lambda_gc()
+            return self.lambda_gc
+        # The buffer is sorted with NaNs last, so the median p-value is its middle element(s)
+        n = len(self.sorted_logp) - int(np.count_nonzero(np.isnan(self.sorted_logp)))
+        middle = self.sorted_logp[max(n - 1, 0) // 2:n // 2 + 1].astype(np.float64)
+        self.lambda_gc = lambda_engine.lambda_from_median_p(lambda_engine.median_p(10 ** -middle))
         return self.lambda_gc
 
-    def create_manhattan_plot(self, output_file: str = "manhattan_plot.png", dpi: int = 600):
-        """Generate Manhattan plot with highlighted significant SNPs."""
-        plt.figure(figsize=(15, 8))
-        
-        # Sort data by chromosome and position
-        data = self.data.sort_values(['Chr', 'bp'])
-        
-        # Calculate cumulative position
-        data['pos'] = 0
-        offset = 0
-        xticks = []
-        
-        # Process each chromosome
-        for chrom in sorted(data['Chr'].unique()):
-            chunk = data[data['Chr'] == chrom]
-            data.loc[chunk.index, 'pos'] = chunk['bp'] + offset
-            xticks.append(offset + (chunk['bp'].max() - chunk['bp'].min())/2)
-            offset += chunk['bp'].max()
-        
-        # Plot points
-        colors = ['#0073CF', '#FF8C00']
-        for idx, chrom in enumerate(sorted(data['Chr'].unique())):
-            chunk = data[data['Chr'] == chrom]
-            
-            # Plot all points
-            plt.scatter(chunk['pos'], chunk['-log10p'], 
-                       c=colors[idx % 2], s=2, alpha=0.7)
-            
-            # Highlight significant points with black circles
-            sig_points = chunk[chunk['p'] < self.suggestive_threshold]
-            if not sig_points.empty:
-                plt.scatter(sig_points['pos'], sig_points['-log10p'],
-                          facecolors='none', edgecolors='black', 
-                          s=50, alpha=1, linewidth=1)
+    def save_stratified_lambda(self, output_file: str, ld_score_file: str = None):
+        """Save lambda per chromosome, MAF bin and LD score bin."""
+        if self.stream_result is not None:
+            print("\nStratified lambda needs all SNPs in memory; skipped in streaming mode")
+            return
+        ld_scores = lambda_engine.read_ld_scores(ld_score_file) if ld_score_file else None
+        strata = lambda_engine.stratified_lambda(self.data, ld_scores)
+        strata.to_csv(output_file, sep='\t', index=False)
+        print(f"\nSaved stratified lambda for {len(strata)} strata to: {output_file}")
+
+    def save_lambda_sketch(self, output_file: str):
+        """Save a mergeable p-value sketch for combining lambda across result files."""
+        if self.stream_result is not None:
+            sketch = self.stream_result.histogram
+        else:
+            sketch = lambda_engine.build_sketch(self.data['p'].to_numpy())
+        lambda_engine.save_sketch(sketch, output_file)
+        print(f"\nSaved lambda sketch to: {output_file}")
+
+    def count_below(self, threshold: float) -> int:
+        """Number of SNPs with p below a threshold."""
+        if self.stream_result is not None:
+            return self.stream_result.count_below(threshold)
+        # Buffer is sorted by descending -log10(p)
+        return int(np.searchsorted(-self.sorted_logp, np.log10(threshold), side='left'))
+
+    def create_manhattan_plot(self, output_file: str = "manhattan_plot.png", dpi: int = 600,
+                              thin: bool = True):
+        """Generate Manhattan plot with highlighted significant SNPs.
+
+        With thin=True non-suggestive SNPs are collapsed to the plot resolution
+        and rasterized; suggestive and significant SNPs are always drawn exactly.
+        """
+        figsize = (15, 8)
+        plt.figure(figsize=figsize)
+        
+        if self.stream_result is not None:
+            data = self.stream_result.manhattan_frame()
+        else:
+            data = self.data
+        data = data[data['Chr'].notna()]
+        
+        # Cumulative positions and thinning are computed in vectorized passes
+        xticks, chromosomes = draw_manhattan(
+            plt.gca(), data['Chr'].to_numpy(), data['bp'].to_numpy(),
+            data['-log10p'].to_numpy(), data['p'].to_numpy(),
+            self.suggestive_threshold, figsize=figsize, dpi=dpi, thin=thin
+        )
         
         # Add threshold lines without labels
         plt.axhline(y=-np.log10(self.significant_threshold), color='red', 
@@ -110,7 +167,7 @@ class GWASAnalyzer:
         # Customize plot
         plt.xlabel('Chromosome')
         plt.ylabel('-log10(p-value)')
-        plt.xticks(xticks, sorted(data['Chr'].unique()))
+        plt.xticks(xticks, chromosomes)
         plt.title(f'{self.trait_name} Manhattan Plot (λ = {self.lambda_gc:.2f})')
         
         # Add grid
@@ -122,19 +179,30 @@ class GWASAnalyzer:
         print(f"\nSaved Manhattan plot to: {output_file} (DPI: {dpi})")
         plt.close()
 
-    def create_qq_plot(self, output_file: str = "qq_plot.png", dpi: int = 600):
-        """Generate Q-Q plot of observed vs expected p-values."""
+    def create_qq_plot(self, output_file: str = "qq_plot.png", dpi: int = 600, thin: bool = True):
+        """Generate Q-Q plot of observed vs expected p-values with a 95% confidence band.
+
+        With thin=True the null region below -log10(p) = 3 is reduced to a fixed
+        number of quantile points; every tail point is still drawn.
+        """
         plt.figure(figsize=(8, 8))
         
         # Calculate observed and expected p-values
-        observed = -np.log10(np.sort(self.data['p']))
-        expected = -np.log10(np.linspace(1/len(observed), 1, len(observed)))
-        
-        # Plot the diagonal line
-        plt.plot([0, max(expected)], [0, max(expected)], 'r--', alpha=0.5)
+        if self.stream_result is not None:
+            expected, observed = self.stream_result.qq_points()
+            n = self.stream_result.histogram.n
+        else:
+            observed = self.sorted_logp[np.isfinite(self.sorted_logp)]
+            n = len(observed)
+            if thin:
+                ranks = qq_thin_ranks(observed)
+            else:
+                ranks = np.arange(1, n + 1)
+            observed = observed[ranks - 1]
+            expected = -np.log10(ranks / n)
         
-        # Plot the Q-Q points
-        plt.scatter(expected, observed, c='blue', s=2, alpha=0.5)
+        # Plot the confidence band, diagonal line and Q-Q points
+        draw_qq(plt.gca(), expected, observed, n)
         
         # Customize plot
         plt.xlabel('Expected -log10(p)')
@@ -150,35 +218,104 @@ class GWASAnalyzer:
         print(f"\nSaved Q-Q plot to: {output_file} (DPI: {dpi})")
         plt.close()
 
+    def summary(self) -> dict:
+        """Lambda, hit counts and top SNP of this trait, for cross-trait tables."""
+        top = self.data.loc[self.data['p'].idxmin()] if len(self.data) else None
+        return {
+            'trait': self.trait_name,
+            'n_snps': self.n_snps,
+            'lambda': self.lambda_gc,
+            'n_significant': self.count_below(self.significant_threshold),
+            'n_suggestive': self.count_below(self.suggestive_threshold),
+            'top_snp': top['SNP'] if top is not None else None,
+            'top_chr': top['Chr'] if top is not None else None,
+            'top_bp': top['bp'] if top is not None else None,
+            'top_p': top['p'] if top is not None else None,
+        }
+
     def save_significant_snps(self, output_file: str, threshold: float = 1e-4):
         """Save significant SNPs to a file."""
         significant = self.data[self.data['p'] < threshold].sort_values('p')
         significant.to_csv(output_file, index=False, sep='\t')
         print(f"\nSaved {len(significant)} significant SNPs to: {output_file}")
 
+    def save_loci(self, output_file: str, threshold: float = 1e-4, window_kb: float = 500,
+                  bfile: str = None, r2_threshold: float = 0.2):
+        """Clump significant SNPs into independent loci and save CHR/START/END regions.
+
+        Without bfile SNPs closer than window_kb are merged; with a reference
+        PLINK fileset SNPs are grouped around lead SNPs by LD (r²) within the window.
+        """
+        significant = self.data[self.data['p'] < threshold]
+        loci = clump(significant, window_kb=window_kb, bfile=bfile, r2_threshold=r2_threshold)
+        loci.to_csv(output_file, index=False, sep='\t')
+        print(f"\nClumped {len(significant)} significant SNPs into {len(loci)} loci: {output_file}")
+        return loci
+
 def main():
     if len(sys.argv) == 1:
         # Interactive mode
         analyzer = GWASAnalyzer()
         output_prefix = input("Enter output prefix for files (default: gwas_output): ") or "gwas_output"
         dpi = int(input("Enter DPI for plot (default: 600): ") or "600")
+        thin = True
+        lambda_strata, ld_scores, sketch = False, None, False
+        clump_options = None
     else:
         # Command line mode
         parser = argparse.ArgumentParser(description='GWAS Analysis')
         parser.add_argument('input_file', help='Input MLMA file')
         parser.add_argument('--snps', type=int, help='Total number of SNPs analyzed')
+        parser.add_argument('--trait', help='Trait name (prompted for if omitted)')
         parser.add_argument('--out', default='gwas_output', help='Output prefix')
         parser.add_argument('--dpi', type=int, default=600, help='DPI for plot output')
+        parser.add_argument('--stream', action='store_true',
+                            help='Read the MLMA file in chunks with bounded memory')
+        parser.add_argument('--chunksize', type=int, default=1_000_000,
+                            help='Rows per chunk in streaming mode')
+        parser.add_argument('--top-k', type=int, default=10_000,
+                            help='Number of top SNPs kept in streaming mode')
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Parse the MLMA text without using the column cache')
+        parser.add_argument('--lambda-strata', action='store_true',
+                            help='Report lambda per chromosome, MAF bin and LD score bin')
+        parser.add_argument('--ld-scores', help='LDSC .l2.ldscore file for LD score strata')
+        parser.add_argument('--sketch', action='store_true',
+                            help='Save a mergeable p-value sketch (see lambda_engine.py)')
+        parser.add_argument('--clump', action='store_true',
+                            help='Group significant SNPs into loci (lead SNP and CHR/START/END)')
+        parser.add_argument('--clump-kb', type=float, default=500,
+                            help='Clumping window in kb')
+        parser.add_argument('--clump-bfile',
+                            help='Reference PLINK fileset prefix for LD-aware clumping')
+        parser.add_argument('--clump-r2', type=float, default=0.2,
+                            help='r² threshold for LD-aware clumping')
+        parser.add_argument('--no-thin', action='store_true',
+                            help='Draw every SNP in the Manhattan and Q-Q plots instead of thinning')
         args = parser.parse_args()
         
-        analyzer = GWASAnalyzer(args.input_file, args.snps)
+        analyzer = GWASAnalyzer(args.input_file, args.snps, stream=args.stream,
+                                chunksize=args.chunksize, top_k=args.top_k,
+                                use_cache=not args.no_cache, trait_name=args.trait)
         output_prefix = args.out
         dpi = args.dpi
+        thin = not args.no_thin
+        lambda_strata, ld_scores, sketch = args.lambda_strata, args.ld_scores, args.sketch
+        clump_options = None
+        if args.clump:
+            clump_options = {'window_kb': args.clump_kb, 'bfile': args.clump_bfile,
+                             'r2_threshold': args.clump_r2}
 
     # Create plots and save results
-    analyzer.create_manhattan_plot(f"{output_prefix}_manhattan.png", dpi=dpi)
-    analyzer.create_qq_plot(f"{output_prefix}_qq.png", dpi=dpi)
+    analyzer.create_manhattan_plot(f"{output_prefix}_manhattan.png", dpi=dpi, thin=thin)
+    analyzer.create_qq_plot(f"{output_prefix}_qq.png", dpi=dpi, thin=thin)
     analyzer.save_significant_snps(f"{output_prefix}_significant_snps.txt")
+    if clump_options:
+        analyzer.save_loci(f"{output_prefix}_loci.txt", **clump_options)
+    if lambda_strata:
+        analyzer.save_stratified_lambda(f"{output_prefix}_lambda_strata.txt", ld_scores)
+    if sketch:
+        analyzer.save_lambda_sketch(f"{output_prefix}_lambda_sketch.npz")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import traceback
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def read_manifest(manifest_file: str) -> pd.DataFrame:
+    """Read a two-column (file, trait) tab-separated manifest without header."""
+    manifest = pd.read_csv(manifest_file, sep='\t', header=None, usecols=[0, 1],
+                           names=['file', 'trait'], dtype=str, comment='#')
+    # Relative paths are resolved against the manifest's directory
+    base = os.path.dirname(os.path.abspath(manifest_file))
+    manifest['file'] = [f if os.path.isabs(f) else os.path.join(base, f) for f in manifest['file']]
+    return manifest
+
+
+def scan_directory(directory: str, extensions: tuple = ('.mlma',)) -> pd.DataFrame:
+    """List files with one of the extensions in a directory, using the file name without it as the trait name."""
+    files = sorted(f for f in os.listdir(directory)
+                   if f.endswith(extensions) and os.path.isfile(os.path.join(directory, f)))
+    return pd.DataFrame({
+        'file': [os.path.join(directory, f) for f in files],
+        'trait': [os.path.splitext(f)[0] for f in files],
+    })
+
+
+def limit_worker_memory(max_memory_gb: float):
+    """Process pool initializer: cap the address space of each worker."""
+    import matplotlib
+    matplotlib.use('Agg')
+    if max_memory_gb:
+        import resource
+        limit = int(max_memory_gb * 1024 ** 3)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def process_trait(filepath: str, trait: str, output_dir: str, options: dict) -> dict:
+    """Run parse, lambda, plots and significant-SNP export for one trait."""
+    from gwas_analyser import GWASAnalyzer
+
+    try:
+        analyzer = GWASAnalyzer(filepath, stream=options['stream'],
+                                chunksize=options['chunksize'], top_k=options['top_k'],
+                                use_cache=options['use_cache'], trait_name=trait)
+        prefix = os.path.join(output_dir, trait)
+        analyzer.create_manhattan_plot(f"{prefix}_manhattan.png", dpi=options['dpi'],
+                                       thin=options['thin'])
+        analyzer.create_qq_plot(f"{prefix}_qq.png", dpi=options['dpi'], thin=options['thin'])
+        analyzer.save_significant_snps(f"{prefix}_significant_snps.txt")
+        result = analyzer.summary()
+        result['status'] = 'ok'
+    except MemoryError:
+        result = {'trait': trait, 'status': 'out of memory'}
+    except Exception as e:
+        traceback.print_exc()
+        result = {'trait': trait, 'status': f'error: {e}'}
+    result['file'] = filepath
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch GWAS post-processing for many traits')
+    parser.add_argument('input', help='Directory of .mlma files or a manifest (file<TAB>trait)')
+    parser.add_argument('--out', default='gwas_batch', help='Output directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--max-memory-gb', type=float, default=None,
+                        help='Address-space limit per worker in GB')
+    parser.add_argument('--dpi', type=int, default=600, help='DPI for plot output')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read MLMA files in chunks with bounded memory')
+    parser.add_argument('--chunksize', type=int, default=1_000_000,
+                        help='Rows per chunk in streaming mode')
+    parser.add_argument('--top-k', type=int, default=10_000,
+                        help='Number of top SNPs kept in streaming mode')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Parse the MLMA text without using the column cache')
+    parser.add_argument('--no-thin', action='store_true',
+                        help='Draw every SNP in the Manhattan and Q-Q plots instead of thinning')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.input):
+        traits = scan_directory(args.input)
+    else:
+        traits = read_manifest(args.input)
+    if traits.empty:
+        print("No .mlma files found!")
+        sys.exit(1)
+    duplicated = traits['trait'][traits['trait'].duplicated()].unique()
+    if len(duplicated):
+        print(f"Error: duplicated trait names: {', '.join(duplicated)}")
+        sys.exit(1)
+
+    os.makedirs(args.out, exist_ok=True)
+    options = {
+        'stream': args.stream,
+        'chunksize': args.chunksize,
+        'top_k': args.top_k,
+        'use_cache': not args.no_cache,
+        'dpi': args.dpi,
+        'thin': not args.no_thin,
+    }
+
+    print(f"Processing {len(traits)} traits with {args.workers} workers")
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=limit_worker_memory,
+                             initargs=(args.max_memory_gb,)) as pool:
+        futures = [pool.submit(process_trait, row.file, row.trait, args.out, options)
+                   for row in traits.itertuples()]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{len(results)}/{len(traits)}] {result['trait']}: {result['status']}")
+
+    # Cross-trait summary in manifest order
+    columns = ['trait', 'status', 'n_snps', 'lambda', 'n_significant', 'n_suggestive',
+               'top_snp', 'top_chr', 'top_bp', 'top_p', 'file']
+    summary = pd.DataFrame(results).reindex(columns=columns)
+    summary = summary.set_index('trait').loc[traits['trait']].reset_index()
+    summary_file = os.path.join(args.out, 'summary.txt')
+    summary.to_csv(summary_file, sep='\t', index=False)
+
+    print(f"\nCross-trait summary saved to: {summary_file}")
+    print(summary[['trait', 'status', 'lambda', 'n_significant', 'n_suggestive', 'top_snp']].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
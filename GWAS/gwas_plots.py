@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+def manhattan_positions(chrom: np.ndarray, bp: np.ndarray):
+    """Cumulative genome positions from one grouped pass over (Chr, bp).
+
+    Returns (pos, chromosomes, xticks, chrom_index) where chrom_index maps every
+    SNP to the position of its chromosome in the sorted chromosome list.
+    """
+    chromosomes, chrom_index = np.unique(chrom, return_inverse=True)
+    extent = pd.Series(bp).groupby(chrom_index).agg(['min', 'max'])
+    # Each chromosome starts where the previous one's last position ended
+    offsets = np.concatenate([[0], np.cumsum(extent['max'].to_numpy())[:-1]]).astype(np.float64)
+    pos = bp + offsets[chrom_index]
+    xticks = offsets + (extent['max'].to_numpy() - extent['min'].to_numpy()) / 2
+    return pos, chromosomes, xticks, chrom_index
+
+
+def thin_points(x: np.ndarray, y: np.ndarray, group: np.ndarray, n_x: int, n_y: int) -> np.ndarray:
+    """Indices of the highest point in every occupied (group, x-cell, y-cell) bin."""
+    if len(x) == 0:
+        return np.array([], dtype=np.int64)
+    x_span = max(x.max() - x.min(), 1)
+    y_span = max(y.max() - y.min(), 1e-12)
+    cell_x = ((x - x.min()) / x_span * (n_x - 1)).astype(np.int64)
+    cell_y = ((y - y.min()) / y_span * (n_y - 1)).astype(np.int64)
+    key = (group.astype(np.int64) * n_x + cell_x) * n_y + cell_y
+    return pd.Series(y).groupby(key).idxmax().to_numpy()
+
+
+def draw_manhattan(ax, chrom, bp, logp, p, suggestive_threshold: float,
+                   figsize=(15, 8), dpi: int = 600, thin: bool = True, marker_size: float = 2):
+    """Draw a Manhattan plot on ax and return (xticks, chromosome labels).
+
+    SNPs below suggestive_threshold are always drawn exactly. With thin=True the
+    remaining points are collapsed to one point per marker-sized cell per
+    chromosome and drawn as a single rasterized layer, so the cost depends on
+    the image size instead of the SNP count.
+    """
+    chrom = np.asarray(chrom)
+    bp = np.asarray(bp, dtype=np.float64)
+    logp = np.asarray(logp, dtype=np.float64)
+    p = np.asarray(p, dtype=np.float64)
+
+    pos, chromosomes, xticks, chrom_index = manhattan_positions(chrom, bp)
+    exact = p < suggestive_threshold
+    dense = np.nonzero(~exact)[0]
+
+    if thin and len(dense):
+        # One cell per marker diameter: more points in a cell would only overdraw
+        marker_px = max(np.sqrt(marker_size) * dpi / 72, 1)
+        n_x = max(int(figsize[0] * dpi / marker_px), 1)
+        n_y = max(int(figsize[1] * dpi / marker_px), 1)
+        dense = dense[thin_points(pos[dense], logp[dense], chrom_index[dense], n_x, n_y)]
+
+    colors = np.array(['#0073CF', '#FF8C00'])
+    ax.scatter(pos[dense], logp[dense], c=colors[chrom_index[dense] % 2],
+               s=marker_size, alpha=0.7, rasterized=thin)
+
+    # Suggestive and significant SNPs are drawn point by point on top
+    ax.scatter(pos[exact], logp[exact], c=colors[chrom_index[exact] % 2],
+               s=marker_size, alpha=0.7)
+    ax.scatter(pos[exact], logp[exact], facecolors='none', edgecolors='black',
+               s=50, alpha=1, linewidth=1)
+
+    return xticks, chromosomes
+
+
+def qq_thin_ranks(sorted_logp: np.ndarray, tail_logp: float = 3.0, n_quantiles: int = 2000) -> np.ndarray:
+    """1-based ranks to draw on a Q-Q plot from -log10(p) sorted in descending order.
+
+    Every point whose observed or expected -log10(p) reaches tail_logp is kept;
+    the dense null region below it is reduced to n_quantiles ranks spaced evenly
+    on the expected -log10(p) scale.
+    """
+    n = len(sorted_logp)
+    if n == 0:
+        return np.array([], dtype=np.int64)
+    n_tail_obs = int(np.searchsorted(-sorted_logp, -tail_logp, side='right'))
+    n_tail_exp = int(np.floor(n * 10 ** -tail_logp))
+    n_tail = min(max(n_tail_obs, n_tail_exp), n)
+    tail = np.arange(1, n_tail + 1)
+    top = min(-np.log10((n_tail + 1) / n), tail_logp) if n_tail < n else 0
+    body = np.rint(n * 10 ** -np.linspace(top, 0, n_quantiles)).astype(np.int64)
+    body = body[(body > n_tail) & (body <= n)]
+    return np.unique(np.concatenate([tail, body]))
+
+
+def qq_band(ranks: np.ndarray, n: int, confidence: float = 0.95):
+    """Lower and upper -log10(p) of the order-statistic confidence band at the given ranks."""
+    alpha = (1 - confidence) / 2
+    upper = -np.log10(stats.beta.ppf(alpha, ranks, n - ranks + 1))
+    lower = -np.log10(stats.beta.ppf(1 - alpha, ranks, n - ranks + 1))
+    return lower, upper
+
+
+def draw_qq(ax, expected: np.ndarray, observed: np.ndarray, n: int, band: bool = True):
+    """Draw Q-Q points, the null diagonal and, optionally, the 95% confidence band."""
+    max_expected = max(expected) if len(expected) else 1
+    if band and len(expected):
+        ranks = np.clip(np.rint(n * 10.0 ** -np.asarray(expected)), 1, n)
+        lower, upper = qq_band(ranks, n)
+        ax.fill_between(expected, lower, upper, color='grey', alpha=0.2, linewidth=0)
+    ax.plot([0, max_expected], [0, max_expected], 'r--', alpha=0.5)
+    ax.scatter(expected, observed, c='blue', s=2, alpha=0.5)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import sys
+import numpy as np
+import pandas as pd
+from scipy import stats
+from mlma_stream import LogPHistogram
+
+MAF_BINS = [0, 0.01, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5]
+
+
+def lambda_from_median_p(median_p: float) -> float:
+    """Genomic inflation factor from the median p-value (one chi-square transform)."""
+    return stats.chi2.isf(median_p, 1) / stats.chi2.ppf(0.5, 1)
+
+
+def median_p(p: np.ndarray) -> float:
+    """Median p-value by selection (np.partition) instead of a full sort."""
+    p = np.asarray(p, dtype=np.float64)
+    p = p[~np.isnan(p)]
+    n = len(p)
+    if n == 0:
+        return np.nan
+    mid = n // 2
+    if n % 2:
+        return np.partition(p, mid)[mid]
+    part = np.partition(p, [mid - 1, mid])
+    # Average on the chi-square scale so even-length results match np.median of chi2
+    chi2_mid = stats.chi2.isf(part[[mid - 1, mid]], 1).mean()
+    return stats.chi2.sf(chi2_mid, 1)
+
+
+def calculate_lambda(p: np.ndarray) -> float:
+    """Genomic inflation factor of a p-value array."""
+    return lambda_from_median_p(median_p(p))
+
+
+def read_ld_scores(filepath: str) -> pd.Series:
+    """Read an LDSC .l2.ldscore(.gz) file and return L2 indexed by SNP."""
+    ld = pd.read_csv(filepath, sep=r'\s+', usecols=['SNP', 'L2'])
+    return ld.drop_duplicates('SNP').set_index('SNP')['L2']
+
+
+def stratified_lambda(data: pd.DataFrame, ld_scores: pd.Series = None,
+                      maf_bins=MAF_BINS, n_ld_bins: int = 5) -> pd.DataFrame:
+    """Lambda per chromosome, MAF bin and (optionally) LD score bin.
+
+    All strata are labelled up front and each is reduced to its median p with
+    median_p, so the chi-square transform is applied once per stratum rather
+    than per SNP and a single stratum gives the same lambda as calculate_lambda.
+    """
+    maf = np.minimum(data['Freq'], 1 - data['Freq'])
+    strata = pd.DataFrame({
+        'p': data['p'].to_numpy(dtype=np.float64),
+        'Chr': data['Chr'].to_numpy(),
+        'MAF': pd.cut(maf, bins=maf_bins, include_lowest=True).to_numpy(),
+    })
+    if ld_scores is not None:
+        l2 = data['SNP'].map(ld_scores)
+        strata['LD'] = pd.qcut(l2, q=n_ld_bins, duplicates='drop').to_numpy()
+
+    results = []
+    for stratifier in [c for c in ['Chr', 'MAF', 'LD'] if c in strata.columns]:
+        grouped = strata.groupby(stratifier, sort=True, observed=True)['p']
+        summary = grouped.agg(size='size', median=median_p).reset_index()
+        results.append(pd.DataFrame({
+            'stratifier': stratifier,
+            'stratum': summary[stratifier].astype(str),
+            'n_snps': summary['size'],
+            'median_p': summary['median'],
+            'lambda': lambda_from_median_p(summary['median'].to_numpy()),
+        }))
+    return pd.concat(results, ignore_index=True)
+
+
+def build_sketch(p: np.ndarray) -> LogPHistogram:
+    """Mergeable -log10(p) sketch of a p-value array."""
+    sketch = LogPHistogram()
+    sketch.add(np.asarray(p, dtype=np.float64))
+    return sketch
+
+
+def save_sketch(sketch: LogPHistogram, filepath: str):
+    """Save a sketch as a compressed .npz file."""
+    np.savez_compressed(filepath, counts=sketch.counts, bin_width=sketch.bin_width,
+                        max_logp=sketch.max_logp)
+
+
+def load_sketch(filepath: str) -> LogPHistogram:
+    """Load a sketch written by save_sketch."""
+    with np.load(filepath) as f:
+        sketch = LogPHistogram(float(f['bin_width']), float(f['max_logp']))
+        sketch.counts = f['counts'].astype(np.int64)
+    return sketch
+
+
+def merge_sketches(filepaths) -> LogPHistogram:
+    """Combine per-file sketches, e.g. one per chromosome, into one."""
+    merged = None
+    for filepath in filepaths:
+        sketch = load_sketch(filepath)
+        if merged is None:
+            merged = sketch
+        else:
+            merged.merge(sketch)
+    return merged
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python lambda_engine.py sketch1.npz [sketch2.npz ...]")
+        sys.exit(1)
+
+    merged = merge_sketches(sys.argv[1:])
+    print(f"Combined {len(sys.argv) - 1} sketches covering {merged.n} SNPs")
+    print(f"λ = {lambda_from_median_p(merged.quantile(0.5)):.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from mlma_stream import MLMA_COLUMNS
+
+CACHE_VERSION = 1
+
+# Typed numeric columns stored as one .npy file each
+NUMERIC_COLUMNS = {
+    'Chr': np.float32,
+    'bp': np.int64,
+    'Freq': np.float32,
+    'b': np.float32,
+    'se': np.float32,
+    'p': np.float64,
+}
+
+# String columns stored as int32 codes plus a table of distinct values
+DICTIONARY_COLUMNS = ['SNP', 'A1', 'A2']
+
+
+def read_mlma(filepath: str) -> pd.DataFrame:
+    """Parse an MLMA text file (tab or space separated)."""
+    df = pd.read_csv(filepath, sep=r'\s+')
+    required_columns = set(MLMA_COLUMNS)
+    if not required_columns.issubset(df.columns):
+        raise ValueError(f"Missing required columns. Required: {required_columns}")
+    df['Chr'] = pd.to_numeric(df['Chr'], errors='coerce')
+    return df
+
+
+def file_fingerprint(filepath: str, block_size: int = 1 << 20) -> dict:
+    """Size, mtime and a hash of the first and last block of a file."""
+    st = os.stat(filepath)
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        digest.update(f.read(block_size))
+        if st.st_size > block_size:
+            f.seek(max(st.st_size - block_size, block_size))
+            digest.update(f.read(block_size))
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': digest.hexdigest()}
+
+
+def cache_dir(filepath: str) -> str:
+    return filepath + '.cache'
+
+
+class MLMAStore:
+    """Memory-mapped columnar view of a cached MLMA file."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.n_snps = self.meta['n_snps']
+
+    def __len__(self):
+        return self.n_snps
+
+    def __getitem__(self, column: str):
+        """Numeric columns are returned as read-only memmaps; string columns as Categoricals."""
+        if column in NUMERIC_COLUMNS:
+            return np.load(os.path.join(self.directory, f'{column}.npy'), mmap_mode='r')
+        if column in DICTIONARY_COLUMNS:
+            codes = np.load(os.path.join(self.directory, f'{column}.codes.npy'), mmap_mode='r')
+            values = np.load(os.path.join(self.directory, f'{column}.values.npy'))
+            return pd.Categorical.from_codes(codes, values.astype(str))
+        raise KeyError(column)
+
+    def to_frame(self, columns=None) -> pd.DataFrame:
+        """Build a DataFrame with the requested columns (all MLMA columns by default)."""
+        columns = columns or MLMA_COLUMNS
+        df = pd.DataFrame({column: self[column] for column in columns})
+        # Match pd.to_numeric: integer chromosomes unless some could not be parsed
+        if 'Chr' in df.columns and df['Chr'].notna().all():
+            df['Chr'] = df['Chr'].astype(np.int64)
+        return df
+
+
+def build_cache(filepath: str, df: pd.DataFrame = None) -> MLMAStore:
+    """Convert an MLMA file into a columnar cache next to it."""
+    if df is None:
+        df = read_mlma(filepath)
+    directory = cache_dir(filepath)
+    os.makedirs(directory, exist_ok=True)
+    meta_file = os.path.join(directory, 'meta.json')
+    if os.path.exists(meta_file):
+        os.remove(meta_file)
+
+    for column, dtype in NUMERIC_COLUMNS.items():
+        np.save(os.path.join(directory, f'{column}.npy'), df[column].to_numpy(dtype=dtype))
+    for column in DICTIONARY_COLUMNS:
+        codes, values = pd.factorize(df[column].astype(str))
+        np.save(os.path.join(directory, f'{column}.codes.npy'), codes.astype(np.int32))
+        np.save(os.path.join(directory, f'{column}.values.npy'), values.to_numpy().astype(bytes))
+
+    # meta.json is written last so an interrupted build is never mistaken for a valid cache
+    meta = {'version': CACHE_VERSION, 'n_snps': len(df), 'source': file_fingerprint(filepath)}
+    with open(meta_file, 'w') as f:
+        json.dump(meta, f)
+    return MLMAStore(directory)
+
+
+def is_cache_valid(filepath: str) -> bool:
+    meta_file = os.path.join(cache_dir(filepath), 'meta.json')
+    if not os.path.exists(meta_file):
+        return False
+    with open(meta_file) as f:
+        meta = json.load(f)
+    return meta.get('version') == CACHE_VERSION and meta.get('source') == file_fingerprint(filepath)
+
+
+def open_mlma(filepath: str) -> MLMAStore:
+    """Open the cached store for an MLMA file, building it first if missing or stale."""
+    if is_cache_valid(filepath):
+        return MLMAStore(cache_dir(filepath))
+    print(f"Building column cache for {filepath}...")
+    return build_cache(filepath)
+
+
+def load_mlma(filepath: str, columns=None, use_cache: bool = True) -> pd.DataFrame:
+    """Read MLMA results through the cache, falling back to text parsing if it cannot be written."""
+    if not use_cache:
+        df = read_mlma(filepath)
+        return df[columns] if columns else df
+    try:
+        return open_mlma(filepath).to_frame(columns)
+    except OSError as e:
+        print(f"Warning: could not use column cache ({e}); parsing text instead", file=sys.stderr)
+        df = read_mlma(filepath)
+        return df[columns] if columns else df
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python mlma_cache.py file1.mlma [file2.mlma ...]")
+        sys.exit(1)
+
+    for filepath in sys.argv[1:]:
+        store = open_mlma(filepath)
+        print(f"{filepath}: {len(store)} SNPs cached in {store.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+MLMA_COLUMNS = ['Chr', 'SNP', 'bp', 'A1', 'A2', 'Freq', 'b', 'se', 'p']
+
+# Numeric columns are parsed straight into compact dtypes; p stays float64
+# because GWAS hits routinely fall below the float32 range.
+MLMA_DTYPES = {
+    'Chr': str,
+    'SNP': str,
+    'bp': np.int64,
+    'A1': str,
+    'A2': str,
+    'Freq': np.float32,
+    'b': np.float32,
+    'se': np.float32,
+    'p': np.float64,
+}
+
+
+class LogPHistogram:
+    """Fixed-width histogram of -log10(p) used for lambda and Q-Q in one pass."""
+
+    def __init__(self, bin_width: float = 1e-4, max_logp: float = 30.0):
+        self.bin_width = bin_width
+        self.max_logp = max_logp
+        self.counts = np.zeros(int(np.ceil(max_logp / bin_width)) + 1, dtype=np.int64)
+
+    @property
+    def n(self) -> int:
+        return int(self.counts.sum())
+
+    def add(self, p: np.ndarray):
+        """Add a block of p-values to the histogram."""
+        logp = -np.log10(np.clip(p[np.isfinite(p)], 1e-300, 1.0))
+        idx = np.minimum((logp / self.bin_width).astype(np.int64), len(self.counts) - 1)
+        self.counts += np.bincount(idx, minlength=len(self.counts))
+
+    def merge(self, other: 'LogPHistogram'):
+        """Add the counts of another histogram with the same binning."""
+        if other.bin_width != self.bin_width or len(other.counts) != len(self.counts):
+            raise ValueError("Histograms must share the same binning to be merged")
+        self.counts += other.counts
+
+    def quantile(self, q: float) -> float:
+        """Return the p-value at quantile q (0 = smallest p, 1 = largest p)."""
+        n = self.n
+        if n == 0:
+            return np.nan
+        # Bins are stored by increasing -log10(p), i.e. decreasing p, so walk
+        # them in reverse (smallest p first) and interpolate inside the bin.
+        desc = self.counts[::-1]
+        cum = np.cumsum(desc)
+        target = q * n
+        b = min(int(np.searchsorted(cum, target)), len(cum) - 1)
+        before = cum[b - 1] if b > 0 else 0
+        frac = (target - before) / desc[b] if desc[b] else 0.0
+        bin_idx = len(self.counts) - 1 - b
+        logp = (bin_idx + 1 - frac) * self.bin_width
+        return 10 ** -logp
+
+    def qq_points(self, max_points: int = 5000):
+        """Return (expected, observed) -log10(p) arrays for a thinned Q-Q plot."""
+        n = self.n
+        nonzero = np.nonzero(self.counts)[0][::-1]
+        if n == 0 or len(nonzero) == 0:
+            return np.array([]), np.array([])
+        if len(nonzero) > max_points:
+            nonzero = nonzero[np.linspace(0, len(nonzero) - 1, max_points).astype(np.int64)]
+        # Rank of the first SNP falling in each bin, counted from the smallest p
+        above = np.cumsum(self.counts[::-1])[::-1] - self.counts
+        rank = above[nonzero] + 1
+        observed = (nonzero + 0.5) * self.bin_width
+        expected = -np.log10(rank / n)
+        return expected, observed
+
+
+class MLMAStream:
+    """One-pass summary of an MLMA file: counts, lambda, plot inputs and top SNPs."""
+
+    def __init__(self, keep_threshold: float, exact_threshold: float, top_k: int, bin_bp: int):
+        self.keep_threshold = keep_threshold
+        self.exact_threshold = exact_threshold
+        self.top_k = top_k
+        self.bin_bp = bin_bp
+        self.n_snps = 0
+        self.histogram = LogPHistogram()
+        self.top_snps = pd.DataFrame(columns=MLMA_COLUMNS + ['-log10p'])
+        self.bins = None
+
+    def lambda_gc(self) -> float:
+        """Genomic inflation factor from the streamed median p-value."""
+        median_p = self.histogram.quantile(0.5)
+        return stats.chi2.isf(median_p, 1) / stats.chi2.ppf(0.5, 1)
+
+    def count_below(self, threshold: float) -> int:
+        """Number of SNPs with p below a threshold no larger than keep_threshold."""
+        return int((self.top_snps['p'] < threshold).sum())
+
+    def manhattan_frame(self) -> pd.DataFrame:
+        """Binned background plus every SNP below exact_threshold, for plotting."""
+        background = self.bins.reset_index()
+        background['bp'] = background['bin'] * self.bin_bp + self.bin_bp // 2
+        background['p'] = 10 ** -background['-log10p']
+        exact = self.top_snps[self.top_snps['p'] < self.exact_threshold]
+        frame = pd.concat([background[['Chr', 'bp', 'p', '-log10p']],
+                           exact[['Chr', 'bp', 'p', '-log10p']]], ignore_index=True)
+        return frame.dropna(subset=['Chr'])
+
+    def qq_points(self, max_points: int = 5000):
+        """Exact Q-Q points for the retained SNPs, histogram quantiles for the rest."""
+        n = self.histogram.n
+        tail_obs = self.top_snps['-log10p'].to_numpy(dtype=np.float64)
+        tail_exp = -np.log10(np.arange(1, len(tail_obs) + 1) / n)
+        expected, observed = self.histogram.qq_points(max_points)
+        if len(tail_exp):
+            body = expected < tail_exp[-1]
+            expected, observed = expected[body], observed[body]
+        return np.concatenate([tail_exp, expected]), np.concatenate([tail_obs, observed])
+
+    def _update(self, chunk: pd.DataFrame):
+        chunk['Chr'] = pd.to_numeric(chunk['Chr'], errors='coerce')
+        chunk['-log10p'] = -np.log10(chunk['p'])
+        self.n_snps += len(chunk)
+        self.histogram.add(chunk['p'].to_numpy())
+
+        # Bounded top-k / below-threshold selection: candidates from this chunk
+        # are merged with the running set and trimmed back immediately.
+        keep = chunk[chunk['p'] < self.keep_threshold]
+        if len(keep) < self.top_k:
+            keep = chunk.nsmallest(self.top_k, 'p')
+        merged = pd.concat([self.top_snps, keep], ignore_index=True) if len(self.top_snps) else keep
+        below = merged['p'] < self.keep_threshold
+        if below.sum() < self.top_k:
+            merged = merged.nsmallest(self.top_k, 'p')
+        else:
+            merged = merged[below]
+        self.top_snps = merged
+
+        # Maximum -log10(p) per (Chr, bin) for everything drawn as background
+        located = chunk[chunk['Chr'].notna()]
+        background = located[located['p'] >= self.exact_threshold]
+        chunk_bins = background.groupby(
+            [background['Chr'], (background['bp'] // self.bin_bp).rename('bin')]
+        )['-log10p'].max()
+        if self.bins is None:
+            self.bins = chunk_bins
+        else:
+            self.bins = pd.concat([self.bins, chunk_bins]).groupby(level=[0, 1]).max()
+
+
+def stream_mlma(filepath: str, chunksize: int = 1_000_000, top_k: int = 10_000,
+                keep_threshold: float = 1e-4, exact_threshold: float = 1e-5,
+                bin_bp: int = 10_000) -> MLMAStream:
+    """Read an MLMA file in chunks with a fixed memory ceiling.
+
+    Only SNPs below keep_threshold (or the top_k by p-value) are retained as rows;
+    everything else is folded into a -log10(p) histogram and per-bin maxima.
+    """
+    header = pd.read_csv(filepath, sep=r'\s+', nrows=0).columns
+    required_columns = set(MLMA_COLUMNS)
+    if not required_columns.issubset(header):
+        raise ValueError(f"Missing required columns. Required: {required_columns}")
+
+    result = MLMAStream(keep_threshold, exact_threshold, top_k, bin_bp)
+    reader = pd.read_csv(filepath, sep=r'\s+', usecols=MLMA_COLUMNS,
+                         dtype=MLMA_DTYPES, chunksize=chunksize)
+    for chunk in reader:
+        result._update(chunk[MLMA_COLUMNS])
+
+    result.top_snps = result.top_snps.sort_values('p').reset_index(drop=True)
+    if result.bins is None:
+        result.bins = pd.Series(dtype=np.float64, name='-log10p',
+                                index=pd.MultiIndex.from_arrays([[], []], names=['Chr', 'bin']))
+    return result
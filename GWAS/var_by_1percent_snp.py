@@ -1,26 +1,35 @@
 #!/usr/bin/env python3
 
 import os
+import sys
+import argparse
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from mlma_cache import open_mlma
+from gwas_batch import read_manifest, scan_directory
+
+DEFAULT_FRACTIONS = [0.0001, 0.001, 0.01, 0.05, 0.1, 0.25, 0.5]
 
 def calculate_variance(file_path):
     """Calculate variance explained by top 1% SNPs"""
     try:
-        # Read MLMA file
-        df = pd.read_csv(file_path, sep='\t')
+        # Open the cached columns of the MLMA file (built on first use)
+        store = open_mlma(file_path)
+        freq = store['Freq'].astype(np.float64)
+        p = store['p']
         
         # Calculate genetic variance per SNP
-        df['vg'] = 2 * df['Freq'] * (1 - df['Freq']) * (df['b'] ** 2)
+        vg = 2 * freq * (1 - freq) * (store['b'].astype(np.float64) ** 2)
         
-        # Total genetic variance
-        total_vg = df['vg'].sum()
+        # Total genetic variance (SNPs with missing Freq or b are skipped)
+        total_vg = np.nansum(vg)
         
-        # Get top 1% SNPs
-        num_top = int(np.ceil(len(df) * 0.01))
-        top_snps = df.nsmallest(num_top, 'p')
-        top_vg = top_snps['vg'].sum()
+        # Get top 1% SNPs; argpartition ranks NaN p-values last, like nsmallest
+        num_top = int(np.ceil(len(store) * 0.01))
+        top_idx = np.argpartition(p, num_top - 1)[:num_top]
+        top_vg = np.nansum(vg[top_idx])
         
         # Calculate percentage
         percent_explained = (top_vg/total_vg) * 100
@@ -29,13 +38,86 @@ def calculate_variance(file_path):
             'total_vg': total_vg,
             'top_vg': top_vg,
             'percent': percent_explained,
-            'n_snps': len(df),
+            'n_snps': len(store),
             'n_top': num_top
         }
     except Exception as e:
         print(f"Error processing {file_path}: {str(e)}")
         return None
 
+def variance_curve(file_path, fractions=DEFAULT_FRACTIONS):
+    """Cumulative variance explained by the top fraction of SNPs, for every fraction.
+
+    SNPs are ordered once by p-value; each fraction is then a lookup into the
+    cumulative sum of per-SNP genetic variance. As with a pandas sum, SNPs with
+    missing Freq or b add nothing; SNPs with a missing p are ranked last.
+    """
+    store = open_mlma(file_path)
+    freq = store['Freq'].astype(np.float64)
+    vg = 2 * freq * (1 - freq) * (store['b'].astype(np.float64) ** 2)
+    
+    order = np.argsort(store['p'], kind='stable')
+    cum_vg = np.nancumsum(vg[order])
+    total_vg = cum_vg[-1]
+    
+    n_snps = len(store)
+    n_top = np.clip(np.ceil(n_snps * np.asarray(fractions)).astype(np.int64), 1, n_snps)
+    top_vg = cum_vg[n_top - 1]
+    return pd.DataFrame({
+        'fraction': fractions,
+        'n_top': n_top,
+        'top_vg': top_vg,
+        'total_vg': total_vg,
+        'percent': top_vg / total_vg * 100,
+        'n_snps': n_snps,
+    })
+
+def _curve_for_trait(file_path, trait, fractions):
+    try:
+        curve = variance_curve(file_path, fractions)
+        curve.insert(0, 'Trait', trait)
+        return curve
+    except Exception as e:
+        print(f"Error processing {file_path}: {str(e)}")
+        return None
+
+def plot_variance_curves(curves, output_file='variance_curve.png'):
+    """Plot the variance-explained curve of every trait on one figure"""
+    fig, ax = plt.subplots(figsize=(10, 6))
+    for trait, curve in curves.groupby('Trait', sort=False):
+        ax.plot(curve['fraction'] * 100, curve['percent'], marker='o', label=trait)
+    
+    ax.set_xscale('log')
+    ax.set_xlabel('Top SNPs (% of all SNPs, ranked by p-value)')
+    ax.set_ylabel('Percentage of Total Genetic Variance Explained')
+    ax.set_title('Cumulative Genetic Variance Explained by Top SNPs')
+    ax.grid(True, which='both', linestyle='--', alpha=0.3)
+    ax.legend(bbox_to_anchor=(1.02, 0.5), loc='center left')
+    
+    plt.tight_layout()
+    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.close()
+
+def run_curves(traits, fractions, workers, output_prefix):
+    """Compute variance curves for all traits in parallel and save table and plot"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        curves = list(pool.map(_curve_for_trait, traits['file'], traits['trait'],
+                               [fractions] * len(traits)))
+    curves = [c for c in curves if c is not None]
+    if not curves:
+        print("No valid results to plot!")
+        return
+    
+    curves = pd.concat(curves, ignore_index=True)
+    curves.to_csv(f'{output_prefix}.csv', index=False)
+    plot_variance_curves(curves, f'{output_prefix}.png')
+    
+    table = curves.pivot(index='Trait', columns='fraction', values='percent')
+    table = table.reindex(curves['Trait'].unique())
+    table.columns = [f'Top {f * 100:g}%' for f in table.columns]
+    print(table.round(2).to_string())
+    print(f"\nCurves saved as '{output_prefix}.csv' and '{output_prefix}.png'")
+
 def plot_variance_results(results):
     """Create horizontal bar plot of variance explained"""
     # Create DataFrame for plotting
@@ -103,6 +185,23 @@ def save_results_to_csv(results):
     df_results.to_csv('variance_results.csv', index=False)
 
 def main():
+    if len(sys.argv) > 1:
+        # Command line mode: variance curves for many traits, no prompts
+        parser = argparse.ArgumentParser(description='Variance explained by top SNPs')
+        parser.add_argument('input', help='Directory of .mlma files or a manifest (file<TAB>trait)')
+        parser.add_argument('--fractions', type=float, nargs='+', default=DEFAULT_FRACTIONS,
+                            help='Fractions of top SNPs (e.g. 0.001 0.01 0.05)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+        parser.add_argument('--out', default='variance_curve', help='Output prefix')
+        args = parser.parse_args()
+        
+        traits = scan_directory(args.input) if os.path.isdir(args.input) else read_manifest(args.input)
+        if traits.empty:
+            print("No .mlma files found!")
+            return
+        run_curves(traits, sorted(args.fractions), args.workers, args.out)
+        return
+
     # Get all .mlma files in current directory
     mlma_files = [f for f in os.listdir() if f.endswith('.mlma')]
     
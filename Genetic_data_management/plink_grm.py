@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from plink_bed import PlinkBed, allele_frequency
+
+
+def part_bounds(n_samples: int, n_parts: int) -> list:
+    """Sample row ranges giving each part about the same number of lower-triangle entries.
+
+    Part k covers rows start..stop-1 against columns 0..stop-1, as in GCTA --make-grm-part.
+    """
+    edges = np.round(n_samples * np.sqrt(np.arange(n_parts + 1) / n_parts)).astype(int)
+    return [(int(edges[k]), int(edges[k + 1])) for k in range(n_parts)]
+
+
+def lower_triangle(matrix: np.ndarray, start: int) -> np.ndarray:
+    """Row-major lower triangle (diagonal included) of rows start.. of a rows x stop block."""
+    rows = np.arange(start, start + matrix.shape[0])[:, None]
+    cols = np.arange(matrix.shape[1])[None, :]
+    return matrix[cols <= rows]
+
+
+def grm_tiles(start: int, stop: int, tile_size: int) -> list:
+    """(row_start, row_stop, col_start, col_stop) sample tiles covering rows start..stop-1 up to the diagonal."""
+    edges = sorted(set(range(0, stop, tile_size)) | {start}) + [stop]
+    tiles = list(zip(edges[:-1], edges[1:]))
+    return [(a, b, c, d) for a, b in tiles if a >= start for c, d in tiles if c <= a]
+
+
+def build_grm(bed: PlinkBed, start: int = 0, stop: int = None, block_size: int = 4096,
+              threads: int = None, freq: np.ndarray = None, tile_size: int = 1024):
+    """GCTA genomic relationship matrix for sample rows start..stop-1 against samples 0..stop-1.
+
+    SNP blocks are standardized as (g - 2p) / sqrt(2p(1-p)) with missing set to 0.
+    Z·Zᵀ is accumulated by BLAS in float32 tiles on or below the diagonal, each
+    with its own lock. Off-diagonal entries are divided by the number of SNPs
+    called in both samples, and the diagonal uses the GCTA estimator
+    1 + Σ(x² - (1+2p)x + 2p²) / (2p(1-p)) / N.
+    Returns ({tile: (grm, n)}, n_complete): a tile's n is None when no SNP was
+    missing in it, so its count is the n_complete SNPs of the missing-free blocks.
+    """
+    threads = threads or os.cpu_count()
+    stop = bed.n_samples if stop is None else stop
+    if freq is None:
+        freq = np.concatenate(list(bed.map_blocks(lambda a, b, g: allele_frequency(g),
+                                                  block_size, threads)))
+    polymorphic = (freq > 0) & (freq < 1)
+    tiles = {tile: [np.zeros((tile[1] - tile[0], tile[3] - tile[2]), dtype=np.float32), None]
+             for tile in grm_tiles(start, stop, tile_size)}
+    locks = {tile: threading.Lock() for tile in tiles}
+    diag = np.zeros(stop - start, dtype=np.float64)
+    totals = {'n_complete': 0}
+    lock = threading.Lock()
+
+    def accumulate(first, last, g):
+        keep = polymorphic[first:last]
+        if not keep.any():
+            return
+        g = g[keep, :stop]
+        p = freq[first:last][keep, None].astype(np.float32)
+        called = g >= 0
+        x = np.where(called, g, 0).astype(np.float32)
+        var = 2 * p * (1 - p)
+        z = ((x - 2 * p) / np.sqrt(var) * called).T
+        c = None if called.all() else called.T.astype(np.float32)
+        for tile, value in tiles.items():
+            a, b, c0, c1 = tile
+            product = z[a:b] @ z[c0:c1].T
+            shared = c[a:b] @ c[c0:c1].T if c is not None else None
+            with locks[tile]:
+                value[0] += product
+                if shared is not None:
+                    if value[1] is None:
+                        value[1] = shared
+                    else:
+                        value[1] += shared
+
+        x, called = x[:, start:stop], called[:, start:stop]
+        d = (((x ** 2 - (1 + 2 * p) * x + 2 * p ** 2) / var) * called).sum(axis=0)
+        with lock:
+            diag[:] += d
+            if c is None:
+                totals['n_complete'] += len(p)
+
+    for _ in bed.map_blocks(accumulate, block_size, threads):
+        pass
+
+    n_complete = totals['n_complete']
+    for (a, b, c0, c1), (grm, n) in tiles.items():
+        if n is not None:
+            n += n_complete
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grm /= n if n is not None else np.float32(n_complete)
+            if a == c0:
+                rows = np.arange(b - a)
+                n_diag = n[rows, rows] if n is not None else n_complete
+                grm[rows, rows] = 1 + diag[a - start:b - start] / n_diag
+    return tiles, n_complete
+
+
+def lower_rows(tiles: dict, n_complete: int):
+    """Yield (grm, n) row-major lower-triangle segments, one per row of tiles."""
+    for a in sorted({tile[0] for tile in tiles}):
+        row_tiles = sorted((tile, value) for tile, value in tiles.items() if tile[0] == a)
+        grm = np.hstack([value[0] for _, value in row_tiles])
+        n = np.hstack([value[1] if value[1] is not None else np.full(value[0].shape, n_complete, dtype=np.float32)
+                       for _, value in row_tiles])
+        yield lower_triangle(grm, a), lower_triangle(n, a)
+
+
+def write_grm(out: str, ids: pd.DataFrame, tiles: dict, n_complete: int):
+    """Write GCTA binary .grm.bin, .grm.N.bin and .grm.id files from build_grm tiles, row of tiles by row."""
+    with open(f"{out}.grm.bin", 'wb') as grm_file, open(f"{out}.grm.N.bin", 'wb') as n_file:
+        for grm, n in lower_rows(tiles, n_complete):
+            grm.astype(np.float32).tofile(grm_file)
+            n.astype(np.float32).tofile(n_file)
+    ids.to_csv(f"{out}.grm.id", sep='\t', header=False, index=False)
+
+
+def read_grm(prefix: str):
+    """Read a GCTA binary GRM into (ids, grm, n) with full symmetric float32 matrices."""
+    ids = pd.read_csv(f"{prefix}.grm.id", sep=r'\s+', header=None, names=['FID', 'IID'], dtype=str)
+    rows, cols = np.tril_indices(len(ids))
+    matrices = []
+    for suffix in ('grm.bin', 'grm.N.bin'):
+        values = np.fromfile(f"{prefix}.{suffix}", dtype=np.float32)
+        if len(values) != len(rows):
+            raise ValueError(f"{prefix}.{suffix} does not match {len(ids)} samples in {prefix}.grm.id")
+        matrix = np.empty((len(ids), len(ids)), dtype=np.float32)
+        matrix[rows, cols] = values
+        matrix[cols, rows] = values
+        matrices.append(matrix)
+    return ids, matrices[0], matrices[1]
+
+
+def part_prefix(out: str, n_parts: int, part: int) -> str:
+    return f"{out}.part_{n_parts}_{part}"
+
+
+def merge_parts(out: str, n_parts: int):
+    """Concatenate GRM parts 1..n_parts into a single GCTA binary GRM."""
+    for suffix in ('grm.bin', 'grm.N.bin', 'grm.id'):
+        with open(f"{out}.{suffix}", 'wb') as merged:
+            for part in range(1, n_parts + 1):
+                part_file = f"{part_prefix(out, n_parts, part)}.{suffix}"
+                if not os.path.exists(part_file):
+                    raise FileNotFoundError(f"Missing GRM part: {part_file}")
+                with open(part_file, 'rb') as f:
+                    while chunk := f.read(1 << 24):
+                        merged.write(chunk)
+
+    n_samples = sum(1 for _ in open(f"{out}.grm.id"))
+    expected = n_samples * (n_samples + 1) // 2 * 4
+    if os.path.getsize(f"{out}.grm.bin") != expected:
+        raise ValueError(f"Merged {out}.grm.bin has the wrong size for {n_samples} samples")
+    return n_samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GCTA-format genomic relationship matrix from PLINK binary genotypes')
+    parser.add_argument('--bfile', help='PLINK fileset prefix (.bed/.bim/.fam)')
+    parser.add_argument('--out', default='plink_grm', help='Output prefix')
+    parser.add_argument('--parts', type=int, default=1, help='Split the GRM into this many parts')
+    parser.add_argument('--part', type=int, default=None,
+                        help='Compute only this part (1-based); others can run in separate processes')
+    parser.add_argument('--merge', action='store_true',
+                        help='Merge the --parts part files of --out into one GRM')
+    parser.add_argument('--block-size', type=int, default=4096, help='SNPs per block')
+    parser.add_argument('--threads', type=int, default=None, help='Worker threads (default: all cores)')
+    args = parser.parse_args()
+
+    if args.merge:
+        n_samples = merge_parts(args.out, args.parts)
+        print(f"Merged {args.parts} parts into {args.out}.grm.bin ({n_samples} samples)")
+        return
+    if not args.bfile:
+        parser.error('--bfile is required unless --merge is given')
+
+    bed = PlinkBed(args.bfile)
+    print(f"Read {bed.n_samples} samples and {bed.n_snps} SNPs from {args.bfile}")
+    freq = np.concatenate(list(bed.map_blocks(lambda a, b, g: allele_frequency(g),
+                                              args.block_size, args.threads)))
+    print(f"Using {int(((freq > 0) & (freq < 1)).sum())} polymorphic SNPs")
+
+    bounds = part_bounds(bed.n_samples, args.parts)
+    parts = [args.part] if args.part else range(1, args.parts + 1)
+    for part in parts:
+        if not 1 <= part <= args.parts:
+            parser.error(f'--part must be between 1 and {args.parts}')
+        start, stop = bounds[part - 1]
+        tiles, n_complete = build_grm(bed, start, stop, args.block_size, args.threads, freq)
+        prefix = args.out if args.parts == 1 else part_prefix(args.out, args.parts, part)
+        write_grm(prefix, bed.fam[['FID', 'IID']].iloc[start:stop], tiles, n_complete)
+        print(f"Saved samples {start + 1}-{stop} to {prefix}.grm.bin")
+
+    if args.parts > 1 and not args.part:
+        merge_parts(args.out, args.parts)
+        print(f"Merged parts into {args.out}.grm.bin")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Genetic_data_management'))
+from plink_bed import PlinkBed, allele_frequency
+
+
+def population_of(fid: pd.Series) -> pd.Series:
+    """Population label of each sample: the FID up to the first underscore."""
+    return fid.astype(str).str.split('_').str[0]
+
+
+def heterozygosity_scan(bed: PlinkBed, populations: pd.Series, block_size: int = 4096,
+                        threads: int = None):
+    """Per-individual and per-SNP heterozygosity counts from one pass over SNP blocks.
+
+    Individuals accumulate observed and expected homozygote counts over their
+    called SNPs as in PLINK --het. For every SNP, called genotypes, heterozygotes
+    and A1 alleles are counted per population with a single product against a
+    samples x populations indicator matrix. Returns (individuals, snp_counts) where
+    snp_counts maps 'called', 'het' and 'a1' to SNPs x populations arrays.
+    """
+    codes, labels = pd.factorize(populations)
+    indicator = np.zeros((bed.n_samples, len(labels)), dtype=np.float32)
+    indicator[np.arange(bed.n_samples), codes] = 1
+    local = threading.local()
+    buffers = []
+
+    def accumulate(start, stop, g):
+        if not hasattr(local, 'sums'):
+            local.sums = np.zeros((3, bed.n_samples))
+            buffers.append(local.sums)
+        called = g >= 0
+        het = g == 1
+        p = allele_frequency(g)[:, None]
+        expected_hom = np.nan_to_num(1 - 2 * p * (1 - p))
+        local.sums[0] += (called & ~het).sum(axis=0)
+        local.sums[1] += (called * expected_hom).sum(axis=0)
+        local.sums[2] += called.sum(axis=0)
+        return (called.astype(np.float32) @ indicator,
+                het.astype(np.float32) @ indicator,
+                np.where(called, g, 0).astype(np.float32) @ indicator)
+
+    blocks = list(bed.map_blocks(accumulate, block_size, threads))
+    snp_counts = {name: np.vstack([block[i] for block in blocks]) if blocks
+                  else np.zeros((0, len(labels)), dtype=np.float32)
+                  for i, name in enumerate(['called', 'het', 'a1'])}
+    snp_counts['populations'] = np.asarray(labels)
+
+    o_hom, e_hom, n = np.sum(buffers, axis=0) if buffers else np.zeros((3, bed.n_samples))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        individuals = pd.DataFrame({
+            'FID': bed.fam['FID'],
+            'IID': bed.fam['IID'],
+            'O(HOM)': o_hom.astype(np.int64),
+            'E(HOM)': e_hom,
+            'N(NM)': n.astype(np.int64),
+            'F': (o_hom - e_hom) / (n - e_hom),
+        })
+    return individuals, snp_counts
+
+
+def snp_heterozygosity(bim: pd.DataFrame, called: np.ndarray, het: np.ndarray,
+                       a1: np.ndarray) -> pd.DataFrame:
+    """Ho, He and F of each SNP from its called/heterozygote/A1 counts."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = a1 / (2 * called)
+        ho = het / called
+        he = 2 * p * (1 - p)
+        return pd.DataFrame({
+            'CHR': bim['CHR'],
+            'SNP': bim['SNP'],
+            'BP': bim['BP'],
+            'N': called.astype(np.int64),
+            'Ho': ho,
+            'He': he,
+            'F': 1 - ho / he,
+        })
+
+
+def sliding_windows(bim: pd.DataFrame, snp_counts: dict, window_kb: float = 1000,
+                    step_kb: float = 500) -> pd.DataFrame:
+    """Ho, He and F in sliding genomic windows, overall and for each population.
+
+    Window sums come from cumulative sums over SNPs, so each window costs two
+    lookups per population: Ho is heterozygotes over called genotypes and He the
+    mean 2p(1-p) over SNPs called in that population.
+    """
+    called = snp_counts['called'].astype(np.float64)
+    het = snp_counts['het'].astype(np.float64)
+    a1 = snp_counts['a1'].astype(np.float64)
+    # Column 0 is all samples together
+    called = np.column_stack([called.sum(axis=1), called])
+    het = np.column_stack([het.sum(axis=1), het])
+    a1 = np.column_stack([a1.sum(axis=1), a1])
+    pops = ['ALL'] + list(snp_counts['populations'])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = a1 / (2 * called)
+    observed = called > 0
+    he = np.where(observed, 2 * p * (1 - p), 0)
+    quantities = np.stack([called, het, he, observed], axis=0)
+
+    window, step = int(window_kb * 1000), int(step_kb * 1000)
+    tables = []
+    chrom = bim['CHR'].to_numpy()
+    bp = bim['BP'].to_numpy()
+    for c in pd.unique(chrom):
+        rows = np.nonzero(chrom == c)[0]
+        rows = rows[np.argsort(bp[rows], kind='stable')]
+        pos = bp[rows]
+        cumulative = np.concatenate([np.zeros((4, 1, len(pops))),
+                                     np.cumsum(quantities[:, rows], axis=1)], axis=1)
+        starts = np.arange((pos[0] // step) * step, pos[-1] + 1, step)
+        first = np.searchsorted(pos, starts, side='left')
+        last = np.searchsorted(pos, starts + window, side='left')
+        keep = last > first
+        starts, first, last = starts[keep], first[keep], last[keep]
+        sums = cumulative[:, last] - cumulative[:, first]
+        n_called, n_het, he_sum, n_observed = sums
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ho = n_het / n_called
+            he_mean = he_sum / n_observed
+            f = 1 - ho / he_mean
+        n_windows = len(starts)
+        tables.append(pd.DataFrame({
+            'CHR': c,
+            'START': np.repeat(starts, len(pops)),
+            'END': np.repeat(starts + window, len(pops)),
+            'N_SNPS': np.repeat(last - first, len(pops)),
+            'POP': np.tile(pops, n_windows),
+            'Ho': ho.ravel(),
+            'He': he_mean.ravel(),
+            'F': f.ravel(),
+        }))
+    if not tables:
+        return pd.DataFrame(columns=['CHR', 'START', 'END', 'N_SNPS', 'POP', 'Ho', 'He', 'F'])
+    return pd.concat(tables, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Heterozygosity per individual, per SNP and in sliding windows')
+    parser.add_argument('--bfile', required=True, help='PLINK fileset prefix (.bed/.bim/.fam)')
+    parser.add_argument('--out', default='results', help='Output prefix')
+    parser.add_argument('--window-kb', type=float, default=1000, help='Sliding window size in kb')
+    parser.add_argument('--step-kb', type=float, default=500, help='Sliding window step in kb')
+    parser.add_argument('--block-size', type=int, default=4096, help='SNPs per block')
+    parser.add_argument('--threads', type=int, default=None, help='Worker threads (default: all cores)')
+    args = parser.parse_args()
+
+    bed = PlinkBed(args.bfile)
+    print(f"Read {bed.n_samples} samples and {bed.n_snps} SNPs from {args.bfile}")
+    individuals, snp_counts = heterozygosity_scan(bed, population_of(bed.fam['FID']),
+                                                  args.block_size, args.threads)
+    individuals.to_csv(f"{args.out}.het", sep='\t', index=False, float_format='%.6g')
+
+    total = {name: snp_counts[name].sum(axis=1) for name in ['called', 'het', 'a1']}
+    snps = snp_heterozygosity(bed.bim, total['called'], total['het'], total['a1'])
+    snps.to_csv(f"{args.out}.snp.het", sep='\t', index=False, float_format='%.6g')
+
+    windows = sliding_windows(bed.bim, snp_counts, args.window_kb, args.step_kb)
+    windows.to_csv(f"{args.out}.window.het", sep='\t', index=False, float_format='%.6g')
+
+    print(f"Saved {args.out}.het, {args.out}.snp.het and {args.out}.window.het "
+          f"({int((windows['POP'] == 'ALL').sum())} windows)")
+
+
+if __name__ == "__main__":
+    main()
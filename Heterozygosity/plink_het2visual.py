@@ -2,42 +2,31 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 import argparse
+from het_engine import population_of
 
-def calculate_heterozygosity(row):
-    """Calculate observed and expected heterozygosity from PLINK .het output"""
-    n_nm = row['N(NM)']
-    o_hom = row['O(HOM)']
-    e_hom = row['E(HOM)']
+def calculate_heterozygosity(df):
+    """Calculate observed and expected heterozygosity from PLINK .het output columns"""
+    n_nm = df['N(NM)']
     
     # Calculate observed heterozygosity
-    ho = (n_nm - o_hom) / n_nm
+    ho = (n_nm - df['O(HOM)']) / n_nm
     
     # Calculate expected heterozygosity
-    he = (n_nm - e_hom) / n_nm
+    he = (n_nm - df['E(HOM)']) / n_nm
     
-    return pd.Series({'Ho': ho, 'He': he})
+    return pd.DataFrame({'Ho': ho, 'He': he})
 
 def prepare_population_data(df):
     """Extract population information and calculate mean metrics per population"""
     # Extract population from FID
-    df['Population'] = df['FID'].apply(lambda x: x.split('_')[0])
+    df['Population'] = population_of(df['FID'])
     
-    # Create separate dataframes for each metric, filtering negative values
-    ho_df = df[df['Ho'] >= 0]
-    he_df = df[df['He'] >= 0]
-    fis_df = df[df['F'] >= 0]
+    # Negative values are masked so each metric drops them independently
+    metrics = df[['Ho', 'He', 'F']]
+    metrics = metrics.where(metrics >= 0)
     
-    # Calculate statistics for each metric separately
-    ho_stats = ho_df.groupby('Population')['Ho'].agg(['mean', 'std'])
-    he_stats = he_df.groupby('Population')['He'].agg(['mean', 'std'])
-    fis_stats = fis_df.groupby('Population')['F'].agg(['mean', 'std'])
-    
-    # Create a multi-level column structure for the final stats
-    pop_stats = pd.concat({
-        'Ho': ho_stats,
-        'He': he_stats,
-        'F': fis_stats
-    }, axis=1)
+    # One grouped reduction gives a (metric, statistic) column structure
+    pop_stats = metrics.groupby(df['Population']).agg(['mean', 'std'])
     
     return pop_stats
 
@@ -103,11 +92,10 @@ def main():
     args = parser.parse_args()
     
     # Read the .het file
-    df = pd.read_csv(args.het_file, sep='\s+')
+    df = pd.read_csv(args.het_file, sep=r'\s+')
     
     # Calculate heterozygosity metrics
-    het_metrics = df.apply(calculate_heterozygosity, axis=1)
-    df = pd.concat([df, het_metrics], axis=1)
+    df = pd.concat([df, calculate_heterozygosity(df)], axis=1)
     
     # Prepare population-wise statistics
     pop_stats = prepare_population_data(df)
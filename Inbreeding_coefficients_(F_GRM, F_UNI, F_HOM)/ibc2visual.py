@@ -6,6 +6,7 @@ import numpy as np
 import seaborn as sns
 import os
 import sys
+from ibc_engine import PlinkBed, compute_ibc, population_means
 
 def process_inbreeding_data(file_path):
     """Read and process inbreeding coefficient data."""
@@ -13,17 +14,21 @@ def process_inbreeding_data(file_path):
         # Read the data
         df = pd.read_csv(file_path, sep='\t')
         
-        # Set negative F values to 0
-        df[['Fhat1', 'Fhat2', 'Fhat3']] = df[['Fhat1', 'Fhat2', 'Fhat3']].clip(lower=0)
-        
-        # Calculate population means
-        pop_means = df.groupby('FID')[['Fhat1', 'Fhat2', 'Fhat3']].mean()
-        
-        return pop_means
+        # Population means with negative F values set to 0
+        return population_means(df)
     except Exception as e:
         print(f"Error reading file: {e}")
         sys.exit(1)
 
+def compute_inbreeding_data(bfile):
+    """Compute inbreeding coefficients directly from a PLINK binary fileset."""
+    bed = PlinkBed(bfile)
+    print(f"Computing inbreeding coefficients for {bed.n_samples} samples and {bed.n_snps} SNPs...")
+    ibc = compute_ibc(bed)
+    ibc.to_csv(f"{bfile}.ibc", sep='\t', index=False, float_format='%.6g')
+    print(f"Inbreeding coefficients saved to {bfile}.ibc")
+    return population_means(ibc)
+
 def plot_inbreeding_coefficients(pop_means, output_file):
     """Create bar plots for inbreeding coefficients."""
     # Set up the figure with three subplots
@@ -88,7 +93,13 @@ def plot_inbreeding_coefficients(pop_means, output_file):
 
 def main():
     # Get input file name from user
-    input_file = input("Please enter the input .ibc file name: ").strip()
+    input_file = input("Please enter the input .ibc file name or PLINK fileset prefix: ").strip()
+    
+    # A PLINK prefix is computed directly from the genotypes
+    if os.path.exists(f"{input_file}.bed"):
+        pop_means = compute_inbreeding_data(input_file)
+        plot_inbreeding_coefficients(pop_means, input_file + '.png')
+        return
     
     # Check if file exists
     if not os.path.exists(input_file):
@@ -5,25 +5,16 @@ import re
 import numpy as np
 import pandas as pd
 import argparse
-from scipy.cluster.hierarchy import linkage
 from scipy.spatial.distance import squareform
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 from io import StringIO
+from ibs_distance import PlinkBed, ibs_counts, write_condensed, read_condensed
+from pop_distance import population_distances
+from nj_tree import build_tree
+from bootstrap import block_contributions, replicate_distances, bootstrap_support
 
-# Import ETE3 only for Tree data structure, not for rendering
-try:
-    from ete3 import Tree
-except ImportError:
-    print("Warning: ETE3 library not available. Using simple Newick parser.")
-    # Simple Tree class as fallback
-    class Tree:
-        def __init__(self, newick_string=None):
-            self.newick = newick_string
-            self.leaves = []
-            
-        def write(self, format=1):
-            return self.newick
+TREE_TITLES = {"nj": "Neighbor-Joining", "upgma": "UPGMA"}
 
 def parse_arguments():
     """Parse command line arguments"""
@@ -31,10 +22,14 @@ def parse_arguments():
         description="Create a population-based phylogenetic tree from an individual-based distance matrix"
     )
     
-    parser.add_argument("-d", "--dist", required=True,
-                        help="Path to the distance matrix file (.mibs)")
-    parser.add_argument("-i", "--ids", required=True,
-                        help="Path to the IDs file (.mibs.id)")
+    parser.add_argument("-d", "--dist",
+                        help="Path to the distance matrix file (.mibs, .mdist, or .dist.bin from ibs_distance.py)")
+    parser.add_argument("-i", "--ids",
+                        help="Path to the IDs file (.mibs.id, .mdist.id or .dist.id)")
+    parser.add_argument("-b", "--bfile",
+                        help="PLINK fileset prefix; IBS distances are computed directly instead of reading --dist")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Worker threads for distance computation [default: all cores]")
     parser.add_argument("-p", "--pop", 
                         help="Path to the population assignment file (optional)")
     parser.add_argument("-o", "--output", default="population_tree",
@@ -45,10 +40,69 @@ def parse_arguments():
                         help="Regex pattern to extract populations when using auto method [default: ^[A-Z]+]")
     parser.add_argument("--min-samples", type=int, default=1,
                         help="Minimum samples required per population to include in analysis [default: 1]")
+    parser.add_argument("-t", "--tree-method", choices=["nj", "upgma"], default="nj",
+                        help="Tree building method: neighbor-joining or UPGMA [default: nj]")
+    parser.add_argument("--bootstrap", type=int, default=0,
+                        help="Number of SNP-block bootstrap replicates for clade support (requires --bfile) [default: 0]")
+    parser.add_argument("--boot-block-size", type=int, default=1000,
+                        help="SNPs per resampled block in bootstrap mode; the per-block counts take "
+                             "4 bytes x sample pairs x blocks on disk, e.g. 800 GB for 20k samples "
+                             "and 1000 blocks [default: 1000]")
+    parser.add_argument("--boot-max-gb", type=float, default=None,
+                        help="Disk space the bootstrap block counts may use [default: free space at --output]")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for bootstrap trees [default: all cores]")
     parser.add_argument("--no-plots", action="store_true",
                         help="Skip creating plot PDF files")
     
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.bfile and not args.dist:
+        parser.error("either --dist or --bfile is required")
+    if args.bootstrap and not args.bfile:
+        parser.error("--bootstrap requires --bfile")
+    if args.dist and not args.dist.endswith(".dist.bin") and not args.ids:
+        parser.error("--ids is required with a .mibs or .mdist matrix")
+    return args
+
+def read_distance_matrix(args):
+    """Load the individual distance matrix from a .mibs file, a .dist.bin file or a PLINK fileset"""
+    if args.bfile and args.bootstrap:
+        # Per-block contributions are computed once; their sum is the full matrix
+        print(f"Computing IBS distances per {args.boot_block_size}-SNP block from {args.bfile}...")
+        bed = PlinkBed(args.bfile)
+        max_bytes = int(args.boot_max_gb * 1024 ** 3) if args.boot_max_gb else None
+        args.boot_paths = block_contributions(bed, args.output, args.boot_block_size, threads=args.threads,
+                                              max_bytes=max_bytes)
+        diff, called = (np.load(path, mmap_mode='r') for path in args.boot_paths)
+        replicate_distances(diff, called, np.ones(diff.shape[0])).tofile(f"{args.output}.dist.bin")
+        bed.fam[['FID', 'IID']].to_csv(f"{args.output}.dist.id", sep='\t', header=False, index=False)
+        print(f"IBS distances saved to: {args.output}.dist.bin")
+        prefix = args.output
+    elif args.bfile:
+        print(f"Computing IBS distances from {args.bfile}...")
+        bed = PlinkBed(args.bfile)
+        counts = ibs_counts(bed, threads=args.threads)
+        write_condensed(args.output, bed.fam, counts, tile_size=256)
+        print(f"IBS distances saved to: {args.output}.dist.bin")
+        prefix = args.output
+    elif args.dist.endswith(".dist.bin"):
+        prefix = args.dist[:-len(".dist.bin")]
+    else:
+        ids = pd.read_csv(args.ids, sep='\t', header=None)
+        dist_matrix = pd.read_csv(args.dist, sep='\t', header=None).to_numpy(dtype=np.float32)
+        if args.dist.endswith(".mibs"):
+            # PLINK --distance ibs writes IBS similarities; the other routes use 1 - IBS
+            dist_matrix = 1 - dist_matrix
+        if np.nanmax(np.abs(np.diag(dist_matrix))) > 1e-6:
+            raise ValueError(f"{args.dist} does not have a zero diagonal after conversion to 1 - IBS; "
+                             "use a .mibs file from --distance ibs or a .mdist file from --distance 1-ibs")
+        # Make sure the matrix is symmetric, then keep only the upper triangle
+        dist_matrix = (dist_matrix + dist_matrix.T) / 2
+        return ids, squareform(dist_matrix, checks=False)
+    
+    ids, condensed = read_condensed(prefix)
+    ids.columns = [0, 1]
+    return ids, condensed
 
 def extract_population(id_str, pattern="^[A-Z]+"):
     """Extract population identifier from individual ID"""
@@ -59,77 +113,27 @@ def extract_population(id_str, pattern="^[A-Z]+"):
         # Fallback: use first three characters
         return id_str[:3]
 
-def calculate_pop_distance(pop1, pop2, dist_matrix, pop_assignments):
-    """Calculate average distance between two populations"""
-    # Get individuals from each population
-    inds_pop1 = pop_assignments[pop_assignments['population'] == pop1]['individual'].values
-    inds_pop2 = pop_assignments[pop_assignments['population'] == pop2]['individual'].values
-    
-    # Calculate pairwise distances
-    distances = []
-    for ind1 in inds_pop1:
-        for ind2 in inds_pop2:
-            if ind1 != ind2:  # Skip same individual comparisons
-                if ind1 in dist_matrix.index and ind2 in dist_matrix.columns:
-                    distances.append(dist_matrix.loc[ind1, ind2])
-    
-    # Return mean distance (or 0 if no valid comparisons)
-    if distances:
-        return np.mean(distances)
-    else:
-        return 0
-
-def build_neighbor_joining_tree(dist_matrix):
-    """Build a neighbor-joining tree from a distance matrix"""
-    # Ensure diagonal is zero
-    np.fill_diagonal(dist_matrix.values, 0)
-    
-    # Make sure the matrix is symmetric
-    dist_matrix_sym = (dist_matrix + dist_matrix.T) / 2
-    
-    # Convert to condensed distance matrix
-    condensed_dist = squareform(dist_matrix_sym)
-    
-    # Use UPGMA for clustering (scipy doesn't have direct NJ)
-    # This is an approximation - for exact NJ, we'd need Bio.Phylo
-    tree_matrix = linkage(condensed_dist, method='average')
-    
-    # Convert to Newick format using ETE3
-    # This is a simplified approach - for production, consider using Bio.Phylo
-    tree_string = construct_newick_from_linkage(tree_matrix, dist_matrix.index)
-    
-    return Tree(tree_string)
-
-def construct_newick_from_linkage(linkage_matrix, labels):
-    """Construct a Newick tree string from scipy linkage matrix"""
-    n = len(labels)
-    nodes = [f"{label}" for label in labels]
-    
-    for i, (a, b, dist, count) in enumerate(linkage_matrix):
-        a, b = int(a), int(b)
-        new_node = f"({nodes[a]},{nodes[b]}):{dist/2}"
-        nodes.append(new_node)
-    
-    return nodes[-1] + ";"
+def build_neighbor_joining_tree(condensed_dist, labels, method="nj"):
+    """Build a neighbor-joining (or UPGMA) tree from a condensed (upper-triangle) distance matrix"""
+    return build_tree(condensed_dist, labels, method)
 
 def main():
     args = parse_arguments()
     
     print("=== Population Tree Generation ===")
-    print(f"Distance matrix file: {args.dist}")
+    print(f"Distance matrix file: {args.dist or args.bfile}")
     print(f"IDs file: {args.ids}")
     print(f"Output prefix: {args.output}")
     print(f"Population method: {args.method}")
+    print(f"Tree method: {args.tree_method}")
     print()
     
+    # Make sure output directory exists
+    os.makedirs(os.path.dirname(args.output) if os.path.dirname(args.output) else '.', exist_ok=True)
+    
     # Read input files
     print("Reading input files...")
-    ids = pd.read_csv(args.ids, sep='\t', header=None)
-    dist_matrix = pd.read_csv(args.dist, sep='\t', header=None)
-    
-    # Set row and column names
-    dist_matrix.index = ids[0]
-    dist_matrix.columns = ids[0]
+    ids, dist_matrix = read_distance_matrix(args)
     
     # Process population assignments
     print("Processing population assignments...")
@@ -194,70 +198,52 @@ def main():
             ]
             print(f"After filtering: {len(population_assignments['population'].unique())} populations remain.")
     
-    # Make sure output directory exists
-    os.makedirs(os.path.dirname(args.output) if os.path.dirname(args.output) else '.', exist_ok=True)
-    
     # Build individual-based tree
     print("Building individual-based tree...")
-    individual_tree = build_neighbor_joining_tree(dist_matrix)
+    individual_tree = build_neighbor_joining_tree(dist_matrix, ids[0], args.tree_method)
     
     # Save individual tree in Newick format
     individual_tree_file = f"{args.output}_individual.newick"
-    individual_tree.write(outfile=individual_tree_file, format=1)  # format=1 is Newick
+    individual_tree.write(outfile=individual_tree_file)
     print(f"Individual tree saved to: {individual_tree_file}")
     
     # Plot tree if requested
     if not args.no_plots:
         # Write tree to text file instead of PDF
-        newick_str = individual_tree.write(format=1)
-        
-        # Save as text file
         with open(f"{args.output}_individual.txt", "w") as f:
-            f.write("Individual-Based Neighbor-Joining Tree\n\n")
-            f.write(newick_str)
+            f.write(f"Individual-Based {TREE_TITLES[args.tree_method]} Tree\n\n")
+            individual_tree.write_newick(f)
         
         print(f"Individual tree info saved to: {args.output}_individual.txt")
     
     # Create population-level distance matrix
     print("Building population-based tree...")
     pop_names = population_assignments['population'].unique()
-    pop_dist_matrix = pd.DataFrame(
-        np.zeros((len(pop_names), len(pop_names))),
-        index=pop_names,
-        columns=pop_names
-    )
     
-    # Fill the population distance matrix
+    # Mean distances between and within populations in one pass over the matrix
     print("Calculating population distances...")
-    for i, pop1 in enumerate(pop_names):
-        for j, pop2 in enumerate(pop_names[i:], i):
-            if pop1 != pop2:
-                dist_val = calculate_pop_distance(
-                    pop1, pop2, 
-                    dist_matrix, population_assignments
-                )
-                pop_dist_matrix.loc[pop1, pop2] = dist_val
-                pop_dist_matrix.loc[pop2, pop1] = dist_val  # Matrix is symmetric
-        
-        # Show progress
-        if (i + 1) % 5 == 0 or i + 1 == len(pop_names):
-            print(f"Progress: {i + 1} of {len(pop_names)} populations processed")
+    individual_pops = population_assignments.drop_duplicates('individual').set_index('individual')['population']
+    labels = individual_pops.reindex(ids[0]).to_numpy()
+    pop_dist_matrix = population_distances(dist_matrix, labels, list(pop_names))
+    pop_dist_matrix.to_csv(f"{args.output}_population_distances.txt", sep='\t')
+    print(f"Population distance matrix saved to: {args.output}_population_distances.txt")
     
     # Build NJ tree for populations
-    pop_tree = build_neighbor_joining_tree(pop_dist_matrix)
+    # Within-population means are kept in the saved matrix but not used for the tree
+    pop_tree = build_neighbor_joining_tree(squareform(pop_dist_matrix.to_numpy(), checks=False), pop_names,
+                                           args.tree_method)
     
     # Save population-based tree in Newick format
     pop_tree_file = f"{args.output}_population.newick"
-    pop_tree.write(outfile=pop_tree_file, format=1)
+    pop_tree.write(outfile=pop_tree_file)
     print(f"Population-based tree saved to: {pop_tree_file}")
     
     # Plot population-based tree
     if not args.no_plots:
         # Save population tree as text file
-        newick_str = pop_tree.write(format=1)
         with open(f"{args.output}_population.txt", "w") as f:
-            f.write("Population-Based Neighbor-Joining Tree\n\n")
-            f.write(newick_str)
+            f.write(f"Population-Based {TREE_TITLES[args.tree_method]} Tree\n\n")
+            pop_tree.write_newick(f)
         print(f"Population tree info saved to: {args.output}_population.txt")
         
         # Create a simple text representation of the colored tree
@@ -272,10 +258,21 @@ def main():
                 f.write(f"- {pop}: {count} individuals\n")
             
             f.write("\nTree structure:\n")
-            f.write(individual_tree.write(format=1))
+            individual_tree.write_newick(f)
         
         print(f"Colored individual tree info saved to: {args.output}_individual_colored.txt")
     
+    # Bootstrap support for both trees
+    if args.bootstrap:
+        print(f"Running {args.bootstrap} bootstrap replicates...")
+        support_individual, support_population = bootstrap_support(
+            args.boot_paths, ids[0], labels, pop_names, individual_tree, pop_tree,
+            n_replicates=args.bootstrap, method=args.tree_method, workers=args.workers
+        )
+        individual_tree.write(outfile=individual_tree_file, support=support_individual)
+        pop_tree.write(outfile=pop_tree_file, support=support_population)
+        print(f"Trees annotated with bootstrap support (%): {individual_tree_file}, {pop_tree_file}")
+    
     # Print summary information
     print("\n=== Summary ===")
     print(f"Total individuals: {len(ids)}")
@@ -283,6 +280,7 @@ def main():
     print("\nOutput files created:")
     print(f"- {args.output}_individual.newick (Individual tree)")
     print(f"- {args.output}_population.newick (Population tree)")
+    print(f"- {args.output}_population_distances.txt (Population distance matrix)")
     if not args.no_plots:
         print(f"- {args.output}_individual.txt (Individual tree info)")
         print(f"- {args.output}_population.txt (Population tree info)")
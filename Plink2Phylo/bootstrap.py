@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from scipy.spatial.distance import squareform
+from ibs_distance import PlinkBed, tile_counters, count_block, condensed_counts
+from pop_distance import population_distances
+from nj_tree import build_tree
+
+# Per-block counts are stored as uint16, so a block may hold at most this many SNPs
+MAX_BOOT_BLOCK = 32767
+
+
+def block_count_bytes(n_samples: int, n_snps: int, boot_block_size: int) -> int:
+    """Disk size of the two (blocks x pairs) uint16 count files written by block_contributions."""
+    n_blocks = -(-n_snps // boot_block_size)
+    return 2 * n_blocks * (n_samples * (n_samples - 1) // 2) * np.dtype(np.uint16).itemsize
+
+
+def block_contributions(bed: PlinkBed, out: str, boot_block_size: int = 1000,
+                        tile_size: int = 256, threads: int = None, max_bytes: int = None) -> tuple:
+    """IBS allele differences and called SNP counts of every SNP block, computed once.
+
+    The genotypes are read in one pass with bootstrap-sized blocks; a single
+    thread pool and set of tile accumulators is reused, reset after each block.
+    Counts are written as (blocks x pairs) uint16 .npy files in condensed pair
+    order, so a bootstrap replicate is just a weighted sum of their rows. The
+    files take 4 bytes per sample pair and block; they must fit in max_bytes
+    (default: the free space next to out) or ValueError is raised up front.
+    Returns the paths of the difference and called-count files.
+    """
+    if boot_block_size > MAX_BOOT_BLOCK:
+        raise ValueError(f"Bootstrap blocks can hold at most {MAX_BOOT_BLOCK} SNPs")
+    size = block_count_bytes(bed.n_samples, bed.n_snps, boot_block_size)
+    if max_bytes is None:
+        max_bytes = shutil.disk_usage(os.path.dirname(os.path.abspath(out))).free
+    if size > max_bytes:
+        raise ValueError(f"Bootstrap block counts need {size / 1024 ** 3:.3g} GB for {bed.n_samples} samples "
+                         f"in {-(-bed.n_snps // boot_block_size)} blocks of {boot_block_size} SNPs, but only "
+                         f"{max_bytes / 1024 ** 3:.3g} GB are available; increase --boot-block-size or --boot-max-gb")
+    threads = threads or os.cpu_count()
+    n_blocks = -(-bed.n_snps // boot_block_size)
+    n_pairs = bed.n_samples * (bed.n_samples - 1) // 2
+    paths = (f"{out}.boot_diff.npy", f"{out}.boot_called.npy")
+    diff_all = np.lib.format.open_memmap(paths[0], mode='w+', dtype=np.uint16, shape=(n_blocks, n_pairs))
+    called_all = np.lib.format.open_memmap(paths[1], mode='w+', dtype=np.uint16, shape=(n_blocks, n_pairs))
+    counts = tile_counters(bed.n_samples, tile_size)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        blocks = bed.iter_blocks(boot_block_size, threads, kind='bits')
+        for b, (start, stop, planes) in enumerate(blocks):
+            for diff, n in counts.values():
+                diff.fill(0)
+                n.fill(0)
+            count_block(pool, counts, planes, stop - start)
+            diff_all[b], called_all[b] = condensed_counts(counts, bed.n_samples, tile_size)
+    diff_all.flush()
+    called_all.flush()
+    return paths
+
+
+def replicate_distances(diff: np.ndarray, called: np.ndarray, weights: np.ndarray,
+                        chunk: int = 1 << 20) -> np.ndarray:
+    """Condensed float32 IBS distances with SNP blocks weighted by their resampling counts.
+
+    Only blocks drawn at least once are read; their uint16 rows are added with
+    integer weights into uint32 accumulators, so no float64 copies are made.
+    """
+    dist = np.empty(diff.shape[1], dtype=np.float32)
+    drawn = np.flatnonzero(weights)
+    diff_sum = np.empty(min(chunk, diff.shape[1]), dtype=np.uint32)
+    called_sum = np.empty_like(diff_sum)
+    for start in range(0, diff.shape[1], chunk):
+        stop = min(start + chunk, diff.shape[1])
+        d, c = diff_sum[:stop - start], called_sum[:stop - start]
+        d.fill(0)
+        c.fill(0)
+        for b in drawn:
+            w = np.uint32(weights[b])
+            d += w * diff[b, start:stop]
+            c += w * called[b, start:stop]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            np.divide(d, 2 * c.astype(np.float32), out=dist[start:stop])
+    return dist
+
+
+def split_keys(tree, leaf_keys: np.ndarray) -> np.ndarray:
+    """Hash of the bipartition below every node (0 for leaves and the root).
+
+    A clade hashes to the XOR of random 64-bit leaf keys; taking the smaller of
+    the hash and its complement makes the key independent of where the tree is
+    rooted, so NJ and UPGMA trees can be compared split by split.
+    """
+    h = np.zeros(len(tree.parent), dtype=np.uint64)
+    h[:tree.n_leaves] = leaf_keys
+    for node in tree.postorder():
+        if node != tree.root:
+            h[tree.parent[node]] ^= h[node]
+    total = np.bitwise_xor.reduce(leaf_keys)
+    keys = np.minimum(h, h ^ total)
+    keys[:tree.n_leaves] = 0
+    keys[tree.root] = 0
+    return keys
+
+
+_worker = {}
+
+
+def _init_worker(paths, labels, pop_labels, pop_names, method, leaf_keys):
+    """Process pool initializer: map the per-block counts once per worker."""
+    _worker['diff'] = np.load(paths[0], mmap_mode='r')
+    _worker['called'] = np.load(paths[1], mmap_mode='r')
+    _worker.update(labels=labels, pop_labels=pop_labels, pop_names=pop_names, method=method,
+                   leaf_keys=leaf_keys)
+
+
+def _replicate(seed: int):
+    """Build one bootstrap replicate; returns the split keys of its individual and population trees."""
+    diff, called = _worker['diff'], _worker['called']
+    rng = np.random.default_rng(seed)
+    weights = np.bincount(rng.integers(0, diff.shape[0], diff.shape[0]), minlength=diff.shape[0])
+    dist = replicate_distances(diff, called, weights)
+
+    tree = build_tree(dist, _worker['labels'], _worker['method'])
+    individual = split_keys(tree, _worker['leaf_keys'][:len(_worker['labels'])])
+
+    pop_names = _worker['pop_names']
+    pop_matrix = population_distances(dist, _worker['pop_labels'], pop_names)
+    pop_tree = build_tree(squareform(pop_matrix.to_numpy(), checks=False), pop_names, _worker['method'])
+    population = split_keys(pop_tree, _worker['leaf_keys'][:len(pop_names)])
+    return individual[individual > 0], population[population > 0]
+
+
+def bootstrap_support(paths, labels, pop_labels, pop_names, individual_tree, pop_tree,
+                      n_replicates: int = 100, method: str = "nj", workers: int = None,
+                      seed: int = 1):
+    """Percentage of bootstrap replicates containing each split of the two main trees.
+
+    SNP blocks are resampled with replacement, replicate distance matrices are
+    formed from the stored per-block counts, and replicate trees are built in a
+    process pool. Returns per-node support arrays (NaN for leaves and the root).
+    """
+    leaf_keys = np.random.default_rng(seed).integers(1, 2 ** 63, size=max(len(labels), len(pop_names)),
+                                                     dtype=np.uint64)
+    main_individual = split_keys(individual_tree, leaf_keys[:len(labels)])
+    main_population = split_keys(pop_tree, leaf_keys[:len(pop_names)])
+    hits_individual = np.zeros(len(main_individual))
+    hits_population = np.zeros(len(main_population))
+
+    seeds = np.random.default_rng(seed + 1).integers(0, 2 ** 32, size=n_replicates)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=(paths, list(labels), pop_labels, list(pop_names), method,
+                                       leaf_keys)) as pool:
+        for done, (individual, population) in enumerate(pool.map(_replicate, seeds), 1):
+            hits_individual += np.isin(main_individual, individual)
+            hits_population += np.isin(main_population, population)
+            if done % 10 == 0 or done == n_replicates:
+                print(f"Bootstrap: {done} of {n_replicates} replicates done")
+
+    support_individual = np.where(main_individual > 0, 100 * hits_individual / n_replicates, np.nan)
+    support_population = np.where(main_population > 0, 100 * hits_population / n_replicates, np.nan)
+    return support_individual, support_population
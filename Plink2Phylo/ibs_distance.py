@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Genetic_data_management'))
+from plink_bed import PlinkBed
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(words: np.ndarray, axis: int = -1) -> np.ndarray:
+        """Number of set bits of uint64 words, summed along an axis."""
+        return np.bitwise_count(words).sum(axis=axis, dtype=np.uint32)
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def popcount(words: np.ndarray, axis: int = -1) -> np.ndarray:
+        """Number of set bits of uint64 words, summed along an axis."""
+        counts = _POPCOUNT_TABLE[np.ascontiguousarray(words).view(np.uint8)]
+        counts = counts.reshape(words.shape[:-1] + (-1,))
+        return counts.sum(axis=axis, dtype=np.uint32)
+
+
+def tile_pairs(n_samples: int, tile_size: int) -> list:
+    """(row_start, row_stop, col_start, col_stop) sample tiles covering the upper triangle."""
+    edges = list(range(0, n_samples, tile_size)) + [n_samples]
+    tiles = list(zip(edges[:-1], edges[1:]))
+    return [(a, b, c, d) for i, (a, b) in enumerate(tiles) for (c, d) in tiles[i:]]
+
+
+def tile_counters(n_samples: int, tile_size: int) -> dict:
+    """Zeroed {tile: (diff, n_called)} uint32 accumulators for every upper-triangle tile."""
+    return {pair: (np.zeros((pair[1] - pair[0], pair[3] - pair[2]), dtype=np.uint32),
+                   np.zeros((pair[1] - pair[0], pair[3] - pair[2]), dtype=np.uint32))
+            for pair in tile_pairs(n_samples, tile_size)}
+
+
+def count_block(pool: ThreadPoolExecutor, counts: dict, planes: tuple, n_snps: int):
+    """Add one bit-plane SNP block to the tile accumulators, one tile per pool task."""
+    ge1, eq2, called = planes
+    # Samples called at every SNP of the block skip the missing-data mask
+    complete = popcount(called, axis=1) == n_snps
+
+    def accumulate(pair):
+        a, b, c, d = pair
+        diff, n = counts[pair]
+        if complete[a:b].all() and complete[c:d].all():
+            diff += popcount(ge1[a:b, None] ^ ge1[None, c:d])
+            diff += popcount(eq2[a:b, None] ^ eq2[None, c:d])
+            n += np.uint32(n_snps)
+        else:
+            both = called[a:b, None] & called[None, c:d]
+            diff += popcount((ge1[a:b, None] ^ ge1[None, c:d]) & both)
+            diff += popcount((eq2[a:b, None] ^ eq2[None, c:d]) & both)
+            n += popcount(both)
+
+    list(pool.map(accumulate, counts))
+
+
+def ibs_counts(bed: PlinkBed, block_size: int = 4096, tile_size: int = 256, threads: int = None) -> dict:
+    """Allele differences and jointly called SNPs for every upper-triangle sample tile.
+
+    Each SNP block is converted to bit planes packed along SNPs, so the allele
+    difference of two samples is popcount(ge1 ^ ge1') + popcount(eq2 ^ eq2') over
+    jointly called SNPs. Tiles are processed in parallel; each tile pair has its own
+    accumulators, and only tiles on or above the diagonal are stored.
+    Returns {tile: (diff, n_called)} with uint32 arrays.
+    """
+    threads = threads or os.cpu_count()
+    counts = tile_counters(bed.n_samples, tile_size)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for start, stop, planes in bed.iter_blocks(block_size, threads, kind='bits'):
+            count_block(pool, counts, planes, stop - start)
+    return counts
+
+
+def condensed_row_blocks(counts: dict, n_samples: int, tile_size: int):
+    """Yield (diff, n_called) condensed segments, one per row of tiles, in squareform order."""
+    for a in range(0, n_samples, tile_size):
+        row_tiles = sorted((pair, value) for pair, value in counts.items() if pair[0] == a)
+        diff = np.hstack([value[0] for _, value in row_tiles])
+        n = np.hstack([value[1] for _, value in row_tiles])
+        upper = np.triu(np.ones(diff.shape, dtype=bool), k=1)
+        yield diff[upper], n[upper]
+
+
+def condensed_counts(counts: dict, n_samples: int, tile_size: int):
+    """Tile accumulators as condensed (diff, n_called) uint32 arrays."""
+    blocks = list(condensed_row_blocks(counts, n_samples, tile_size))
+    return np.concatenate([b[0] for b in blocks]), np.concatenate([b[1] for b in blocks])
+
+
+def write_condensed(out: str, fam: pd.DataFrame, counts: dict, tile_size: int):
+    """Write IBS distances (1 - IBS) as a float32 condensed upper triangle plus an id file.
+
+    Values are in scipy squareform order (row-major, i < j); pairs with no jointly
+    called SNP are NaN. Rows are written tile by tile, so the full matrix is never formed.
+    """
+    with open(f"{out}.dist.bin", 'wb') as f:
+        for diff, n in condensed_row_blocks(counts, len(fam), tile_size):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                (diff / (2.0 * n)).astype(np.float32).tofile(f)
+    fam[['FID', 'IID']].to_csv(f"{out}.dist.id", sep='\t', header=False, index=False)
+
+
+def read_condensed(prefix: str):
+    """Memory-map a condensed .dist.bin matrix; returns (ids, condensed float32 memmap)."""
+    ids = pd.read_csv(f"{prefix}.dist.id", sep='\t', header=None, names=['FID', 'IID'], dtype=str)
+    n = len(ids)
+    condensed = np.memmap(f"{prefix}.dist.bin", dtype=np.float32, mode='r')
+    if len(condensed) != n * (n - 1) // 2:
+        raise ValueError(f"{prefix}.dist.bin does not match {n} samples in {prefix}.dist.id")
+    return ids, condensed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='IBS distance matrix from PLINK binary genotypes')
+    parser.add_argument('--bfile', required=True, help='PLINK fileset prefix (.bed/.bim/.fam)')
+    parser.add_argument('--out', default='out_ibsdist', help='Output prefix')
+    parser.add_argument('--block-size', type=int, default=4096, help='SNPs per block')
+    parser.add_argument('--tile-size', type=int, default=256, help='Samples per tile')
+    parser.add_argument('--threads', type=int, default=None, help='Worker threads (default: all cores)')
+    args = parser.parse_args()
+
+    bed = PlinkBed(args.bfile)
+    print(f"Read {bed.n_samples} samples and {bed.n_snps} SNPs from {args.bfile}")
+    counts = ibs_counts(bed, args.block_size, args.tile_size, args.threads)
+    write_condensed(args.out, bed.fam, counts, args.tile_size)
+    print(f"Saved {args.out}.dist.bin and {args.out}.dist.id")
+
+
+if __name__ == "__main__":
+    main()
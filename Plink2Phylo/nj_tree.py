@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import io
+import numpy as np
+from scipy.cluster.hierarchy import linkage
+from scipy.spatial.distance import squareform
+
+# Characters that require a quoted Newick label
+_NEWICK_SPECIAL = set(" \t()[]':;,")
+
+
+def _newick_label(label) -> str:
+    label = str(label)
+    if _NEWICK_SPECIAL & set(label):
+        return "'" + label.replace("'", "''") + "'"
+    return label
+
+
+class ArrayTree:
+    """Rooted tree stored as parent and branch-length arrays.
+
+    Nodes 0..n_leaves-1 are the leaves in label order; the root has parent -1.
+    Trees are written to Newick iteratively, so depth is not limited by recursion.
+    """
+
+    def __init__(self, parent: np.ndarray, length: np.ndarray, labels):
+        self.parent = np.asarray(parent, dtype=np.int64)
+        self.length = np.asarray(length, dtype=np.float64)
+        self.labels = list(labels)
+        self.n_leaves = len(self.labels)
+        self.root = int(np.nonzero(self.parent < 0)[0][0])
+        # Children of every node in CSR form
+        has_parent = np.nonzero(self.parent >= 0)[0]
+        order = has_parent[np.argsort(self.parent[has_parent], kind='stable')]
+        counts = np.bincount(self.parent[has_parent], minlength=len(self.parent))
+        self.child_start = np.concatenate([[0], np.cumsum(counts)])
+        self.child_nodes = order
+
+    def children(self, node: int) -> np.ndarray:
+        return self.child_nodes[self.child_start[node]:self.child_start[node + 1]]
+
+    def postorder(self) -> np.ndarray:
+        """Nodes ordered so that every child comes before its parent."""
+        order = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(self.children(node))
+        return np.array(order[::-1], dtype=np.int64)
+
+    def write_newick(self, handle, support=None, buffer_size: int = 1 << 16):
+        """Stream the tree as Newick to a text file handle.
+
+        support optionally gives a value per node, written as the label of
+        internal nodes (NaN values are omitted).
+        """
+        pieces = []
+        size = 0
+        stack = [(self.root, 0)]
+        while stack:
+            node, k = stack.pop()
+            kids = self.children(node)
+            if len(kids) == 0 or k == len(kids):
+                if len(kids) == 0:
+                    text = _newick_label(self.labels[node])
+                else:
+                    text = ')'
+                    if support is not None and not np.isnan(support[node]):
+                        text += f"{support[node]:.0f}"
+                if node != self.root:
+                    text += f":{self.length[node]:.6g}"
+                else:
+                    text += ';\n'
+            else:
+                text = '(' if k == 0 else ','
+                stack.append((node, k + 1))
+                stack.append((int(kids[k]), 0))
+            pieces.append(text)
+            size += len(text)
+            if size >= buffer_size:
+                handle.write(''.join(pieces))
+                pieces, size = [], 0
+        handle.write(''.join(pieces))
+
+    def write(self, outfile: str = None, support=None) -> str:
+        """Write Newick to outfile, or return it as a string when no file is given."""
+        if outfile:
+            with open(outfile, 'w') as f:
+                self.write_newick(f, support)
+            return None
+        handle = io.StringIO()
+        self.write_newick(handle, support)
+        return handle.getvalue().strip()
+
+
+def upgma(condensed: np.ndarray, labels) -> ArrayTree:
+    """UPGMA (average linkage) tree with ultrametric branch lengths."""
+    n = len(labels)
+    if n == 1:
+        return ArrayTree([-1], [0.0], labels)
+    z = linkage(np.asarray(condensed, dtype=np.float64), method='average')
+    parent = np.full(2 * n - 1, -1, dtype=np.int64)
+    height = np.zeros(2 * n - 1)
+    for i, (a, b, dist, _) in enumerate(z):
+        parent[int(a)] = parent[int(b)] = n + i
+        height[n + i] = dist / 2
+    length = np.where(parent >= 0, height[parent] - height, 0)
+    return ArrayTree(parent, length, labels)
+
+
+def _best_pair(D, R, alive, born, sorted_idx, row_len, head, r, window=8):
+    """RapidNJ-style search for the pair minimizing Q = (r-2)·D - R_i - R_j.
+
+    Each row holds the slots alive when it was built, sorted by distance. Rows
+    are scanned together, a window of entries at a time, and a row stops as
+    soon as its lower bound (r-2)·D - R_i - max(R) reaches the best Q found.
+    Entries whose slot died or was reused since the row was built are skipped;
+    those pairs are covered by the newer node's own row.
+    """
+    rows = np.nonzero(alive)[0]
+    coef = r - 2
+    r_max = R[rows].max()
+    best, best_i, best_j = np.inf, -1, -1
+    pos = head[rows].copy()
+    offsets = np.arange(window)
+    first = True
+    while len(rows):
+        cols = pos[:, None] + offsets
+        inside = cols < row_len[rows, None]
+        idx = sorted_idx[rows[:, None], np.minimum(cols, sorted_idx.shape[1] - 1)]
+        valid = inside & alive[idx] & (born[idx] <= born[rows, None])
+        d = D[rows[:, None], idx]
+        r_row = R[rows, None]
+        q = np.where(valid, coef * d - r_row - R[idx], np.inf)
+        k = np.argmin(q)
+        if q.flat[k] < best:
+            best = q.flat[k]
+            best_i, best_j = rows[k // window], idx.flat[k]
+        if first:
+            # Invalid entries stay invalid, so skip leading ones from now on
+            leading = np.argmax(valid | ~inside, axis=1)
+            leading[~(valid | ~inside).any(axis=1)] = window
+            head[rows] += leading
+            first = False
+        done = (valid & (coef * d - r_row - r_max >= best)).any(axis=1) | ~inside[:, -1]
+        rows, pos = rows[~done], pos[~done] + window
+    return best_i, best_j
+
+
+def neighbor_joining(condensed: np.ndarray, labels, window: int = 8) -> ArrayTree:
+    """Neighbor-joining tree (Saitou & Nei) from a float32 condensed distance matrix.
+
+    Works on a square float32 working matrix plus one distance-sorted index row
+    per node, i.e. O(n²) memory. The merged node reuses the slot of one of its
+    children; the minimum-Q pair is found with a bounded RapidNJ-style scan of
+    the sorted rows. Negative branch lengths are set to 0. The tree is rooted
+    at the final three-way join.
+    """
+    n = len(labels)
+    if n < 3:
+        if n == 1:
+            return ArrayTree([-1], [0.0], labels)
+        d = float(condensed[0])
+        return ArrayTree([2, 2, -1], [d / 2, d / 2, 0.0], labels)
+
+    D = squareform(np.asarray(condensed, dtype=np.float32), checks=False)
+    if np.isnan(D).any():
+        raise ValueError("Distance matrix contains missing (NaN) values")
+    parent = np.full(2 * n - 2, -1, dtype=np.int64)
+    length = np.zeros(2 * n - 2)
+    node_of = np.arange(n)
+    alive = np.ones(n, dtype=bool)
+    born = np.zeros(n, dtype=np.int64)
+    R = D.sum(axis=1, dtype=np.float64)
+
+    def build_rows(D):
+        masked = D.copy()
+        np.fill_diagonal(masked, np.inf)
+        return np.argsort(masked, axis=1)[:, :-1].astype(np.int32)
+
+    sorted_idx = build_rows(D)
+    row_len = np.full(n, n - 1, dtype=np.int64)
+    head = np.zeros(n, dtype=np.int64)
+    r = n
+    compact_at = r // 2
+    next_node = n
+    step = 0
+    while r > 3:
+        step += 1
+        i, j = _best_pair(D, R, alive, born, sorted_idx, row_len, head, r, window)
+        d_ij = float(D[i, j])
+        length_i = 0.5 * d_ij + (R[i] - R[j]) / (2 * (r - 2))
+        parent[node_of[i]] = parent[node_of[j]] = next_node
+        length[node_of[i]] = max(length_i, 0.0)
+        length[node_of[j]] = max(d_ij - length_i, 0.0)
+
+        d_new = (D[i] + D[j] - d_ij) / 2
+        alive[i] = alive[j] = False
+        others = np.nonzero(alive)[0]
+        R[others] += d_new[others] - D[i, others] - D[j, others]
+        D[i, :] = d_new
+        D[:, i] = d_new
+        D[i, i] = 0
+        alive[i] = True
+        R[i] = d_new[others].sum(dtype=np.float64)
+        node_of[i] = next_node
+        born[i] = step
+        next_node += 1
+        r -= 1
+
+        sorted_idx[i, :len(others)] = others[np.argsort(d_new[others], kind='stable')]
+        row_len[i] = len(others)
+        row_len[j] = 0
+        head[i] = 0
+
+        if r <= compact_at and r > 3:
+            # Drop dead slots and rebuild all sorted rows
+            keep = np.nonzero(alive)[0]
+            D = D[np.ix_(keep, keep)]
+            R, node_of = R[keep], node_of[keep]
+            alive = np.ones(r, dtype=bool)
+            born = np.zeros(r, dtype=np.int64)
+            sorted_idx = build_rows(D)
+            row_len = np.full(r, r - 1, dtype=np.int64)
+            head = np.zeros(r, dtype=np.int64)
+            compact_at = r // 2
+
+    a, b, c = np.nonzero(alive)[0]
+    root = next_node
+    for x, y, z in ((a, b, c), (b, a, c), (c, a, b)):
+        parent[node_of[x]] = root
+        length[node_of[x]] = max((D[x, y] + D[x, z] - D[y, z]) / 2, 0.0)
+    return ArrayTree(parent, length, labels)
+
+
+def build_tree(condensed: np.ndarray, labels, method: str = "nj") -> ArrayTree:
+    """Tree from a condensed distance matrix with neighbor-joining ('nj') or UPGMA ('upgma')."""
+    if method == "upgma":
+        return upgma(condensed, labels)
+    return neighbor_joining(condensed, labels)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def condensed_rows(condensed: np.ndarray, n: int, start: int, stop: int) -> np.ndarray:
+    """Dense rows start..stop-1 of the upper triangle (zeros on and below the diagonal)."""
+    block = np.zeros((stop - start, n), dtype=np.float32)
+    for i in range(start, stop):
+        offset = i * n - i * (i + 1) // 2
+        block[i - start, i + 1:] = condensed[offset:offset + n - i - 1]
+    return block
+
+
+def population_indicator(labels: np.ndarray, populations: list) -> sparse.csr_matrix:
+    """Sparse samples x populations 0/1 matrix; samples outside populations have empty rows."""
+    column = pd.Index(populations).get_indexer(labels)
+    rows = np.nonzero(column >= 0)[0]
+    return sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, column[rows])),
+                             shape=(len(labels), len(populations)))
+
+
+def population_distances(condensed: np.ndarray, labels: np.ndarray, populations: list = None,
+                         block_size: int = 1024) -> pd.DataFrame:
+    """Mean individual distance between and within populations.
+
+    labels gives the population of each sample of a condensed (upper-triangle)
+    distance matrix, None or NaN for samples that are not used. Row blocks of the
+    upper triangle are multiplied against a sparse population indicator, so the
+    sums over all pairs of every population pair come from Sᵀ·D·S without
+    touching individual pairs in Python. Only i < j pairs are stored, so the
+    diagonal (self comparisons) is excluded. NaN distances are left out of both
+    sums and counts. Populations without any valid pair get a mean of 0.
+    """
+    labels = np.asarray(labels, dtype=object)
+    if populations is None:
+        populations = list(pd.unique(labels[pd.notna(labels)]))
+    n = len(labels)
+    indicator = population_indicator(labels, populations)
+    n_pops = len(populations)
+    sums = np.zeros((n_pops, n_pops))
+    counts = np.zeros((n_pops, n_pops))
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = condensed_rows(condensed, n, start, stop)
+        # Only the strict upper triangle of the block holds pairs
+        upper = np.triu(np.ones((stop - start, n), dtype=bool), k=start + 1)
+        valid = upper & ~np.isnan(block)
+        block[~valid] = 0
+        left = indicator[start:stop].T
+        sums += left @ (indicator.T @ block.T).T
+        counts += left @ (indicator.T @ valid.astype(np.float32).T).T
+
+    # Pairs are counted once (i < j); add the transpose to cover both orders
+    sums = sums + sums.T - np.diag(np.diag(sums))
+    counts = counts + counts.T - np.diag(np.diag(counts))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, 0)
+    return pd.DataFrame(means, index=populations, columns=populations)
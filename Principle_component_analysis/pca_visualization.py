@@ -23,6 +23,19 @@ def get_confidence_ellipse(x, y, confidence=0.95):
     
     return width, height, angle
 
+def plot_projected(projected, pc_x, pc_y):
+    """Overlay projected samples as hollow circles, one colour per population."""
+    if projected is None:
+        return
+    for i, (pop, pop_data) in enumerate(projected.groupby('Population', sort=False)):
+        plt.scatter(pop_data[pc_x], pop_data[pc_y],
+                   marker='o',
+                   facecolors='none',
+                   edgecolors=plt.cm.tab10(i % 10),
+                   label=f'{pop} (projected)',
+                   linewidths=1.5,
+                   s=100)
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='PCA Visualization Tool')
@@ -31,6 +44,7 @@ def main():
     parser.add_argument('--fam', required=True, help='Path to fam file')
     parser.add_argument('--ellipse-pops', nargs='+', help='Populations to draw confidence ellipses for')
     parser.add_argument('--dpi', type=int, default=600, help='DPI for output images')
+    parser.add_argument('--projected', help='Eigenvector file of samples projected with plink_pca.py --project')
     args = parser.parse_args()
 
     # Read the files
@@ -42,6 +56,12 @@ def main():
     eigenvec.columns = ['FID', 'IID'] + [f'PC{i+1}' for i in range(eigenvec.shape[1]-2)]
     eigenvec['Population'] = fam[0]
 
+    projected = None
+    if args.projected:
+        projected = pd.read_table(args.projected, sep=r'\s+', header=None)
+        projected.columns = ['FID', 'IID'] + [f'PC{i+1}' for i in range(projected.shape[1]-2)]
+        projected['Population'] = projected['FID']
+
     # Calculate variance explained
     total_variance = eigenval[0].sum()
     variance_explained = (eigenval[0] / total_variance) * 100
@@ -80,6 +100,8 @@ def main():
                                 fill=False, color=pop_style[pop]['color'], alpha=0.5)
                 plt.gca().add_patch(ellipse)
 
+    plot_projected(projected, 'PC1', 'PC2')
+
     plt.xlabel(f'PC1 ({variance_explained[0]:.2f}%)')
     plt.ylabel(f'PC2 ({variance_explained[1]:.2f}%)')
     plt.title('PC1 vs PC2')
@@ -120,6 +142,8 @@ def main():
                                 fill=False, color=pop_style[pop]['color'], alpha=0.5)
                 plt.gca().add_patch(ellipse)
 
+    plot_projected(projected, 'PC3', 'PC4')
+
     plt.xlabel(f'PC3 ({variance_explained[2]:.2f}%)')
     plt.ylabel(f'PC4 ({variance_explained[3]:.2f}%)')
     plt.title('PC3 vs PC4')
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Genetic_data_management'))
+from plink_bed import PlinkBed, allele_frequency
+
+
+def allele_frequencies(bed: PlinkBed, block_size: int, threads: int) -> np.ndarray:
+    """A1 allele frequency of every SNP (NaN when all genotypes are missing)."""
+    return np.concatenate(list(bed.map_blocks(lambda start, stop, g: allele_frequency(g),
+                                              block_size, threads)))
+
+
+def standardized_block(g: np.ndarray, p: np.ndarray) -> np.ndarray:
+    """Standardized genotypes (samples x SNPs, float32) with missing set to 0.
+
+    g is an int8 SNPs x samples block and p the A1 frequencies of its SNPs.
+    Monomorphic SNPs contribute zeros.
+    """
+    p = p[:, None]
+    sd = np.sqrt(2 * p * (1 - p))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = (g - 2 * p) / sd
+    z[(g < 0) | ~np.isfinite(z)] = 0
+    return z.T.astype(np.float32)
+
+
+def randomized_pca(bed: PlinkBed, n_pcs: int = 20, n_iter: int = 6, oversample: int = None,
+                   block_size: int = 4096, threads: int = None, seed: int = 1):
+    """Top principal components of the genomic relationship matrix Z·Zᵀ/M.
+
+    Blocked randomized subspace iteration: each pass streams SNP blocks and
+    accumulates A·(Aᵀ·Q) for A = Z/sqrt(M), so the GRM itself is never formed.
+    The subspace is oversampled by n_pcs columns unless oversample is given.
+    Returns (eigenvectors, eigenvalues, snp_loadings, freq).
+    """
+    threads = threads or os.cpu_count()
+    freq = allele_frequencies(bed, block_size, threads)
+    polymorphic = (freq > 0) & (freq < 1)
+    m = int(polymorphic.sum())
+    scale = np.float32(1 / np.sqrt(m))
+    rank = min(n_pcs + (oversample or max(n_pcs, 10)), bed.n_samples)
+
+    def pass_over_snps(q, keep_projection=False):
+        def block_product(start, stop, g):
+            a = standardized_block(g, freq[start:stop]) * scale
+            atq = a.T @ q
+            return a @ atq, atq if keep_projection else None
+
+        y = np.zeros((bed.n_samples, q.shape[1]), dtype=np.float64)
+        projections = []
+        for part, atq in bed.map_blocks(block_product, block_size, threads):
+            y += part
+            projections.append(atq)
+        return y, projections
+
+    rng = np.random.default_rng(seed)
+    q, _ = np.linalg.qr(rng.standard_normal((bed.n_samples, rank)))
+    for _ in range(n_iter):
+        y, _ = pass_over_snps(q.astype(np.float32))
+        q, _ = np.linalg.qr(y)
+
+    # Rayleigh-Ritz step: eigen-decompose Qᵀ·A·Aᵀ·Q in the small subspace
+    q32 = q.astype(np.float32)
+    _, projections = pass_over_snps(q32, keep_projection=True)
+    atq = np.vstack(projections).astype(np.float64)
+    eigval, w = np.linalg.eigh(atq.T @ atq)
+    order = np.argsort(eigval)[::-1][:n_pcs]
+    eigval, w = eigval[order], w[:, order]
+
+    eigvec = q @ w
+    loadings = atq @ w / np.sqrt(np.maximum(eigval, 1e-12))
+    # Fix the sign of each PC so that its largest loading is positive
+    flip = np.sign(loadings[np.abs(loadings).argmax(axis=0), np.arange(loadings.shape[1])])
+    flip[flip == 0] = 1
+    return eigvec * flip, eigval, loadings * flip, freq
+
+
+def write_pca(bed: PlinkBed, out: str, eigvec, eigval, loadings, freq):
+    """Write PLINK-style .eigenvec/.eigenval and a .eigenvec.var SNP loading table."""
+    n_pcs = len(eigval)
+    pcs = pd.DataFrame(eigvec, columns=[f'PC{i+1}' for i in range(n_pcs)])
+    vec = pd.concat([bed.fam[['FID', 'IID']], pcs], axis=1)
+    vec.to_csv(f"{out}.eigenvec", sep=' ', header=False, index=False, float_format='%.6g')
+    np.savetxt(f"{out}.eigenval", eigval, fmt='%.6g')
+
+    var = bed.bim[['CHR', 'SNP', 'A1', 'A2']].copy()
+    var['FREQ'] = freq
+    var = pd.concat([var, pd.DataFrame(loadings, columns=pcs.columns)], axis=1)
+    var.to_csv(f"{out}.eigenvec.var", sep='\t', index=False, float_format='%.6g')
+
+
+def read_reference(ref: str):
+    """Read the .eigenvec.var, .eigenval and sample count of a reference PCA."""
+    var = pd.read_csv(f"{ref}.eigenvec.var", sep='\t', dtype={'SNP': str})
+    eigval = np.atleast_1d(np.loadtxt(f"{ref}.eigenval"))
+    n_ref = sum(1 for _ in open(f"{ref}.eigenvec"))
+    return var, eigval, n_ref
+
+
+def shrinkage_factors(eigval: np.ndarray, n_samples: int, n_snps: int) -> np.ndarray:
+    """Asymptotic shrinkage of projected PC scores (Lee, Zou & Wright 2010).
+
+    Sample eigenvalues are converted to the scale of the SNP covariance
+    (mu = lambda * M / n) and the population spike l is recovered from
+    mu = l * (1 + gamma / (l - 1)) with gamma = M / n. PCs below the
+    detection threshold l <= 1 + sqrt(gamma) are left uncorrected.
+    """
+    gamma = n_snps / n_samples
+    mu = eigval * n_snps / n_samples
+    disc = (mu + 1 - gamma) ** 2 - 4 * mu
+    spike = ((mu + 1 - gamma) + np.sqrt(np.maximum(disc, 0))) / 2
+    factors = (spike - 1) / (spike + gamma - 1)
+    detectable = (disc > 0) & (spike > 1 + np.sqrt(gamma))
+    return np.where(detectable, factors, 1.0)
+
+
+def project_samples(bed: PlinkBed, var: pd.DataFrame, eigval: np.ndarray, n_ref: int,
+                    block_size: int = 4096, threads: int = None, shrinkage: bool = True):
+    """Place new samples in a reference PC space using its SNP loadings and frequencies.
+
+    SNPs are matched by ID, with genotypes flipped where A1/A2 are swapped. Missing
+    genotypes and reference SNPs absent from the new data are handled by rescaling
+    each score with the loading mass that was actually observed.
+    """
+    threads = threads or os.cpu_count()
+    pc_cols = [c for c in var.columns if c.startswith('PC')]
+    loadings = var[pc_cols].to_numpy(dtype=np.float64)
+    ref_freq = var['FREQ'].to_numpy(dtype=np.float64)
+    m_ref = int(((ref_freq > 0) & (ref_freq < 1)).sum())
+
+    ref_index = pd.Index(var['SNP']).get_indexer(bed.bim['SNP'])
+    matched = ref_index >= 0
+    same = matched & (bed.bim['A1'].to_numpy() == var['A1'].to_numpy()[ref_index])
+    swapped = matched & (bed.bim['A1'].to_numpy() == var['A2'].to_numpy()[ref_index])
+    usable = same | swapped
+    print(f"Matched {int(usable.sum())} of {len(var)} reference SNPs "
+          f"({int(swapped.sum())} with swapped alleles)")
+
+    def block_scores(start, stop, g):
+        keep = np.nonzero(usable[start:stop])[0]
+        if len(keep) == 0:
+            return 0, 0
+        g = g[keep].astype(np.float32)
+        called = g >= 0
+        flip = swapped[start:stop][keep, None]
+        g = np.where(flip & called, 2 - g, g)
+        idx = ref_index[start:stop][keep]
+        p = ref_freq[idx, None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = (g - 2 * p) / np.sqrt(2 * p * (1 - p))
+        z[~called | ~np.isfinite(z)] = 0
+        v = loadings[idx]
+        return z.T @ v, called.T.astype(np.float32) @ (v ** 2)
+
+    scores = np.zeros((bed.n_samples, len(pc_cols)))
+    mass = np.zeros((bed.n_samples, len(pc_cols)))
+    for part, observed in bed.map_blocks(block_scores, block_size, threads):
+        scores += part
+        mass += observed
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        projected = scores / mass / np.sqrt(m_ref * eigval[:len(pc_cols)])
+    if shrinkage:
+        projected /= shrinkage_factors(eigval[:len(pc_cols)], n_ref, m_ref)
+    return projected
+
+
+def write_projection(bed: PlinkBed, out: str, projected: np.ndarray):
+    """Write projected samples as a PLINK-style .eigenvec file."""
+    pcs = pd.DataFrame(projected, columns=[f'PC{i+1}' for i in range(projected.shape[1])])
+    vec = pd.concat([bed.fam[['FID', 'IID']], pcs], axis=1)
+    vec.to_csv(f"{out}.eigenvec", sep=' ', header=False, index=False, float_format='%.6g')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Randomized PCA on PLINK binary genotypes')
+    parser.add_argument('--bfile', required=True, help='PLINK fileset prefix (.bed/.bim/.fam)')
+    parser.add_argument('--pcs', type=int, default=20, help='Number of PCs to compute')
+    parser.add_argument('--out', default='plink_pca', help='Output prefix')
+    parser.add_argument('--project', metavar='REF',
+                        help='Project --bfile samples onto the reference PCA with this output prefix')
+    parser.add_argument('--no-shrinkage', action='store_true',
+                        help='Do not correct projected scores for shrinkage')
+    parser.add_argument('--iter', type=int, default=6, help='Number of power iterations')
+    parser.add_argument('--block-size', type=int, default=4096, help='SNPs per block')
+    parser.add_argument('--threads', type=int, default=None, help='Worker threads (default: all cores)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+    args = parser.parse_args()
+
+    bed = PlinkBed(args.bfile)
+    print(f"Read {bed.n_samples} samples and {bed.n_snps} SNPs from {args.bfile}")
+
+    if args.project:
+        var, eigval, n_ref = read_reference(args.project)
+        projected = project_samples(bed, var, eigval, n_ref, block_size=args.block_size,
+                                    threads=args.threads, shrinkage=not args.no_shrinkage)
+        write_projection(bed, args.out, projected)
+        print(f"\nSaved projected coordinates of {bed.n_samples} samples to {args.out}.eigenvec")
+        return
+
+    eigvec, eigval, loadings, freq = randomized_pca(
+        bed, n_pcs=args.pcs, n_iter=args.iter, block_size=args.block_size,
+        threads=args.threads, seed=args.seed
+    )
+    write_pca(bed, args.out, eigvec, eigval, loadings, freq)
+
+    print(f"\nTop {len(eigval)} eigenvalues: {', '.join(f'{v:.3f}' for v in eigval[:10])}")
+    print(f"Saved {args.out}.eigenvec, {args.out}.eigenval and {args.out}.eigenvec.var")
+
+
+if __name__ == "__main__":
+    main()
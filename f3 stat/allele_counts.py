@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import re
+import sys
+import gzip
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Genetic_data_management'))
+from plink_bed import PlinkBed
+
+def _group_counts(chunk: pd.DataFrame, pops: list):
+    """Per-SNP (A1 count, observed allele) matrices for a chunk of whole SNP groups.
+
+    Populations missing from a group are marked with -1 observed alleles.
+    """
+    snp_start = np.ones(len(chunk), dtype=bool)
+    snp = chunk['SNP'].to_numpy()
+    snp_start[1:] = snp[1:] != snp[:-1]
+    group = np.cumsum(snp_start) - 1
+    column = pd.Index(pops).get_indexer(chunk['CLST'])
+    known = column >= 0
+
+    a1 = np.zeros((group[-1] + 1, len(pops)), dtype=np.int64)
+    total = np.full((group[-1] + 1, len(pops)), -1, dtype=np.int64)
+    a1[group[known], column[known]] = chunk['MAC'].to_numpy()[known]
+    total[group[known], column[known]] = chunk['NCHROBS'].to_numpy()[known]
+    return snp[snp_start], a1, total
+
+
+def read_frq_strat(filename: str, chunksize: int = 1_000_000):
+    """Stream a PLINK .frq.strat file (plain or gzipped) as per-SNP count arrays.
+
+    The file must list each SNP's populations on consecutive lines, as PLINK
+    --freq --family does. Populations are taken from the first SNP. Yields
+    (pops, snp_ids, a1_counts, allele_totals) with SNPs x populations int arrays;
+    a SNP group cut by a chunk boundary is carried over to the next chunk.
+    """
+    reader = pd.read_csv(filename, sep=r'\s+', usecols=['SNP', 'CLST', 'MAC', 'NCHROBS'],
+                         dtype={'SNP': str, 'CLST': str, 'MAC': str, 'NCHROBS': str},
+                         chunksize=chunksize, compression='infer')
+    pops = None
+    carry = None
+    for chunk in reader:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        mac = pd.to_numeric(chunk['MAC'], errors='coerce')
+        nchrobs = pd.to_numeric(chunk['NCHROBS'], errors='coerce')
+        bad = mac.isna() | nchrobs.isna()
+        if bad.any():
+            print(f"Warning: Skipping {int(bad.sum())} lines with format errors", file=sys.stderr)
+        chunk = chunk.assign(MAC=mac, NCHROBS=nchrobs)[~bad].reset_index(drop=True)
+        if chunk.empty:
+            carry = None
+            continue
+        if pops is None:
+            first = chunk['SNP'].iloc[0]
+            pops = sorted(chunk.loc[chunk['SNP'] == first, 'CLST'].unique())
+
+        # Keep the last SNP group for the next chunk: it may continue there
+        snp = chunk['SNP'].to_numpy()
+        earlier = np.nonzero(snp != snp[-1])[0]
+        last_start = earlier[-1] + 1 if len(earlier) else 0
+        carry = chunk.iloc[last_start:]
+        complete = chunk.iloc[:last_start]
+        if len(complete):
+            yield (pops,) + _group_counts(complete, pops)
+    if carry is not None and len(carry):
+        yield (pops,) + _group_counts(carry.reset_index(drop=True), pops)
+
+
+def genotype_counts(bed: PlinkBed, populations: pd.Series, block_size: int = 4096,
+                    threads: int = None):
+    """Stream per-population A1 counts and observed alleles from PLINK genotypes.
+
+    Counts come from one product of each genotype block with a samples x populations
+    indicator matrix. Yields (pops, snp_ids, a1_counts, allele_totals) per block.
+    """
+    codes, pops = pd.factorize(populations, sort=True)
+    pops = list(pops)
+    indicator = np.zeros((bed.n_samples, len(pops)), dtype=np.float32)
+    indicator[np.arange(bed.n_samples), codes] = 1
+
+    def counts(start, stop, g):
+        called = g >= 0
+        a1 = np.where(called, g, 0).astype(np.float32) @ indicator
+        total = 2 * (called.astype(np.float32) @ indicator)
+        return start, stop, a1.astype(np.int64), total.astype(np.int64)
+
+    snp_ids = bed.bim['SNP'].to_numpy()
+    for start, stop, a1, total in bed.map_blocks(counts, block_size, threads):
+        yield pops, snp_ids[start:stop], a1, total
+
+
+def write_treemix(count_chunks, outfile: str):
+    """Write streamed count arrays as a gzipped TreeMix file (A2,A1 counts per population).
+
+    SNPs missing a population or with no observed alleles in any population are
+    skipped. Returns (pops, valid_snps, total_snps).
+    """
+    pops = None
+    valid_snps = total_snps = 0
+    with gzip.open(outfile, 'wt') as f:
+        for chunk_pops, snp_ids, a1, total in count_chunks:
+            if pops is None:
+                pops = chunk_pops
+                f.write(' '.join(pops) + '\n')
+            total_snps += len(snp_ids)
+            valid = (total > 0).all(axis=1)
+            a1, total = a1[valid], total[valid]
+            if not len(a1):
+                continue
+            cells = pd.DataFrame(total - a1).astype(str) + ',' + pd.DataFrame(a1).astype(str)
+            rows = cells[0]
+            for column in cells.columns[1:]:
+                rows = rows + ' ' + cells[column]
+            f.write('\n'.join(rows) + '\n')
+            valid_snps += len(rows)
+    return pops, valid_snps, total_snps
+
+
+def _treemix_line_error(filename: str, lines: list, first_line: int, n_pops: int) -> ValueError:
+    """Error naming the first line of a chunk that is not one "A2,A1" pair per population."""
+    row = re.compile(r'\s*(?:\d+,\d+(?:\s+\d+,\d+){%d})?\s*' % (n_pops - 1))
+    for i, line in enumerate(lines):
+        if not row.fullmatch(line):
+            fields = len(re.findall(r'[^\s,]+', line))
+            return ValueError(f"{filename} line {first_line + i}: expected {2 * n_pops} integer counts "
+                              f"for {n_pops} populations, found {fields} fields")
+    return ValueError(f"{filename} lines {first_line}-{first_line + len(lines) - 1}: unreadable counts")
+
+
+def read_treemix(filename: str, chunk_bytes: int = 1 << 26):
+    """Stream a TreeMix count file (plain or gzipped) as per-SNP count arrays.
+
+    Each chunk of lines is parsed column-wise in one call instead of line by
+    line; a chunk that does not give two integer counts per population raises
+    ValueError naming the first malformed line.
+    Yields (pops, a1_counts, allele_totals) with SNPs x populations int arrays.
+    """
+    with gzip.open(filename, 'rt') if filename.endswith('.gz') else open(filename) as f:
+        pops = f.readline().split()
+        line_no = 2
+        while True:
+            lines = f.readlines(chunk_bytes)
+            if not lines:
+                break
+            text = ''.join(lines).replace(',', ' ')
+            try:
+                counts = pd.read_csv(io.StringIO(text), sep=r'\s+', header=None, dtype=np.int64).to_numpy()
+            except ValueError:
+                counts = None
+            if counts is None or counts.shape[1] != 2 * len(pops):
+                raise _treemix_line_error(filename, lines, line_no, len(pops))
+            line_no += len(lines)
+            counts = counts.reshape(-1, len(pops), 2)
+            # TreeMix stores "A2,A1" counts per population
+            yield pops, counts[:, :, 1], counts.sum(axis=2)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import hashlib
+from math import comb
+import numpy as np
+import pandas as pd
+
+
+def source_signature(source: str) -> dict:
+    """Path, size and modification time identifying the input a cache was built from."""
+    stat = os.stat(source)
+    return {'source': os.path.abspath(source), 'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+
+def cache_key(signature: dict, pops: list, block_size: int) -> str:
+    text = json.dumps([signature, list(pops), block_size])
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+class RowFile:
+    """A float32 (rows x n_columns) .npy file filled one row at a time.
+
+    The row count need not be known in advance: the header is reserved when
+    the file is opened and rewritten with the final shape on close, so rows go
+    straight to disk and are never held in memory together.
+    """
+
+    def __init__(self, filename: str, n_columns: int):
+        self.filename = filename
+        self.n_columns = n_columns
+        self.n_rows = 0
+        self.file = open(filename, 'wb')
+        self._write_header()
+        self.offset = self.file.tell()
+
+    def _write_header(self):
+        self.file.seek(0)
+        np.lib.format.write_array_header_1_0(self.file, {'descr': '<f4', 'fortran_order': False,
+                                                         'shape': (self.n_rows, self.n_columns)})
+
+    def append(self, row: np.ndarray):
+        np.asarray(row, dtype='<f4').tofile(self.file)
+        self.n_rows += 1
+
+    def close(self):
+        self._write_header()
+        if self.file.tell() != self.offset:
+            raise ValueError(f"Header of {self.filename} changed size")
+        self.file.close()
+
+
+def write_cache(cache_dir: str, signature: dict, block_size: int, pops: list, f2: np.ndarray,
+                sizes: np.ndarray, d_den_file: str = None, complete: bool = True) -> str:
+    """Store per-block f2 sums as a (blocks x pairs) upper-triangle array plus metadata.
+
+    complete marks a cache built from every population of the input. d_den_file
+    is a float32 (blocks x all_quartets) .npy of D denominators, written by
+    compute_blocks, that is moved into the cache. Returns the cache directory.
+    """
+    path = os.path.join(cache_dir, cache_key(signature, pops, block_size))
+    os.makedirs(path, exist_ok=True)
+    upper = np.triu_indices(len(pops), k=1)
+    np.save(os.path.join(path, 'f2.npy'), f2[:, upper[0], upper[1]])
+    np.save(os.path.join(path, 'sizes.npy'), sizes)
+    if d_den_file is not None:
+        os.replace(d_den_file, os.path.join(path, 'd_den.npy'))
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(dict(signature, block_size=block_size, pops=list(pops), complete=complete,
+                       d_stat=d_den_file is not None), f, indent=1)
+    return path
+
+
+def find_cache(cache_dir: str, signature: dict, block_size: int, pops: list = None,
+               d_stat: bool = False) -> str:
+    """Cache directory for this input and block size covering the populations, or None.
+
+    Without pops only a cache built from all populations matches; with pops any
+    cache holding all of them does. d_stat requires stored D denominators.
+    """
+    if not os.path.isdir(cache_dir):
+        return None
+    for name in sorted(os.listdir(cache_dir)):
+        meta_file = os.path.join(cache_dir, name, 'meta.json')
+        if not os.path.exists(meta_file):
+            continue
+        with open(meta_file) as f:
+            meta = json.load(f)
+        if any(meta.get(key) != value for key, value in signature.items()):
+            continue
+        if meta['block_size'] != block_size or (d_stat and not meta['d_stat']):
+            continue
+        if (pops is None and meta['complete']) or (pops is not None and set(pops) <= set(meta['pops'])):
+            return os.path.join(cache_dir, name)
+    return None
+
+
+def load_cache(path: str):
+    """Read a cache; returns (pops, f2, sizes, d_den) with f2 expanded to (blocks x pops x pops).
+
+    d_den is memory-mapped, or None when the cache has no D denominators.
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    pops = meta['pops']
+    condensed = np.load(os.path.join(path, 'f2.npy'))
+    f2 = np.zeros((len(condensed), len(pops), len(pops)))
+    upper = np.triu_indices(len(pops), k=1)
+    f2[:, upper[0], upper[1]] = condensed
+    f2[:, upper[1], upper[0]] = condensed
+    sizes = np.load(os.path.join(path, 'sizes.npy'))
+    d_den = np.load(os.path.join(path, 'd_den.npy'), mmap_mode='r') if meta['d_stat'] else None
+    return pops, f2, sizes, d_den
+
+
+def quartet_index(quartets: np.ndarray, n_pops: int) -> np.ndarray:
+    """Position of each (A, B, C, D) quartet's topology in fstats.all_quartets order.
+
+    The D denominator does not change when A/B, C/D or the two pairs are
+    swapped, so any ordering of a quartet maps to its stored column.
+    """
+    q = np.sort(quartets, axis=1)
+    binom = np.array([[comb(n, k) for k in range(5)] for n in range(n_pops + 1)], dtype=np.int64)
+    rank = binom[n_pops, 4] - 1 - sum(binom[n_pops - 1 - q[:, i], 4 - i] for i in range(4))
+    # Topology: which population is paired with the smallest one
+    low = quartets.min(axis=1)
+    partner = np.where(quartets[:, 0] == low, quartets[:, 1],
+                       np.where(quartets[:, 1] == low, quartets[:, 0],
+                                np.where(quartets[:, 2] == low, quartets[:, 3], quartets[:, 2])))
+    topology = (q[:, 1:] == partner[:, None]).argmax(axis=1)
+    return 3 * rank + topology
+
+
+def parse_tests(filename: str):
+    """Read requested tests, one per line: "T;S1,S2" for f3 or "A,B;C,D" for f4/D.
+
+    Returns (triples, quartets) as arrays of population names.
+    """
+    with open(filename) as f:
+        lines = pd.Series([line.strip() for line in f if line.strip() and not line.startswith('#')], dtype=object)
+    is_f4 = (lines.str.find(',') < lines.str.find(';')).to_numpy()
+    parts = lines.str.split(r'[;,]', regex=True, expand=True).reindex(columns=range(4)).to_numpy()
+    return parts[~is_f4, :3], parts[is_f4, :4]
+
+
+def population_codes(names: np.ndarray, pops: list) -> np.ndarray:
+    """Indices into pops of an array of population names."""
+    codes = pd.Index(pops).get_indexer(names.ravel()).reshape(names.shape)
+    if (codes < 0).any():
+        raise ValueError(f"Unknown population in tests: {names[codes < 0][0]}")
+    return codes
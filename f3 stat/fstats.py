@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+from itertools import combinations
+import numpy as np
+import pandas as pd
+from allele_counts import PlinkBed, read_frq_strat, read_treemix, genotype_counts
+from f2_cache import (RowFile, source_signature, find_cache, write_cache, load_cache, quartet_index,
+                      parse_tests, population_codes)
+
+
+def select_populations(chunks, names: list = None):
+    """Restrict streamed (pops, a1, total) chunks to the named populations, in that order."""
+    for pops, a1, total in chunks:
+        if names:
+            missing = sorted(set(names) - set(pops))
+            if missing:
+                raise ValueError(f"Populations not found in input: {', '.join(missing)}")
+            columns = pd.Index(pops).get_indexer(names)
+            pops, a1, total = list(names), a1[:, columns], total[:, columns]
+        yield pops, a1, total
+
+
+def frequency_blocks(chunks, block_size: int = 500):
+    """Regroup streamed (pops, a1, total) chunks into jackknife blocks of block_size SNPs.
+
+    SNPs with fewer than two observed alleles in any population are dropped
+    before blocking. Yields (pops, p, bias) per block: A1 frequencies and the
+    sampling-noise term ĥ/n = x(n-x) / (n²(n-1)) of every SNP and population.
+    """
+    p_held = bias_held = None
+    for pops, a1, total in chunks:
+        keep = (total >= 2).all(axis=1)
+        a1, total = a1[keep].astype(np.float64), total[keep].astype(np.float64)
+        p = a1 / total
+        bias = a1 * (total - a1) / (total * total * (total - 1))
+        if p_held is not None:
+            p, bias = np.concatenate([p_held, p]), np.concatenate([bias_held, bias])
+        full = len(p) - len(p) % block_size
+        for start in range(0, full, block_size):
+            yield pops, p[start:start + block_size], bias[start:start + block_size]
+        p_held, bias_held = p[full:], bias[full:]
+    if p_held is not None and len(p_held):
+        yield pops, p_held, bias_held
+
+
+def f2_block_sums(p: np.ndarray, bias: np.ndarray) -> np.ndarray:
+    """Bias-corrected f2 of every population pair summed over the SNPs of one block.
+
+    Σ(p_i - p_j)² is expanded into squared sums and one Gram matrix product;
+    the diagonal is 0.
+    """
+    square = (p * p).sum(axis=0)
+    noise = bias.sum(axis=0)
+    f2 = square[:, None] + square[None, :] - 2 * (p.T @ p) - noise[:, None] - noise[None, :]
+    np.fill_diagonal(f2, 0)
+    return f2
+
+
+def all_triples(n_pops: int) -> np.ndarray:
+    """(target, source1, source2) index rows for every f3 test, sources in population order."""
+    return np.array([(c, a, b) for c in range(n_pops)
+                     for a, b in combinations([x for x in range(n_pops) if x != c], 2)],
+                    dtype=np.int64).reshape(-1, 3)
+
+
+def all_quartets(n_pops: int) -> np.ndarray:
+    """(A, B, C, D) index rows for the three distinct f4(A,B;C,D) of every set of four populations."""
+    rows = []
+    for a, b, c, d in combinations(range(n_pops), 4):
+        rows += [(a, b, c, d), (a, c, b, d), (a, d, b, c)]
+    return np.array(rows, dtype=np.int64).reshape(-1, 4)
+
+
+def d_denominator_sums(p: np.ndarray, quartets: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """Σ(a+b-2ab)(c+d-2cd) over the SNPs of one block for every quartet (the D-statistic denominator)."""
+    den = np.empty(len(quartets))
+    for start in range(0, len(quartets), chunk):
+        q = quartets[start:start + chunk]
+        left = p[:, q[:, 0]] + p[:, q[:, 1]] - 2 * p[:, q[:, 0]] * p[:, q[:, 1]]
+        right = p[:, q[:, 2]] + p[:, q[:, 3]] - 2 * p[:, q[:, 2]] * p[:, q[:, 3]]
+        den[start:start + chunk] = np.einsum('sq,sq->q', left, right)
+    return den
+
+
+def compute_blocks(chunks, block_size: int = 500, d_stat: bool = False, quartets: np.ndarray = None,
+                   d_den_file: str = None):
+    """Per-block f2 sums of every population pair, in one pass over streamed allele counts.
+
+    Returns (pops, f2, sizes, d_den): f2 is (blocks x pops x pops), sizes the
+    SNPs per block and d_den the (blocks x quartets) D denominators, or None
+    unless d_stat is set. D denominators are computed for quartets, an array of
+    population names, or for all_quartets order when quartets is None. With
+    d_den_file they are instead written there block by block as a float32 .npy
+    and d_den is None.
+    """
+    pops, f2, sizes, d_den = None, [], [], []
+    rows = None
+    try:
+        for pops, p, bias in frequency_blocks(chunks, block_size):
+            f2.append(f2_block_sums(p, bias))
+            sizes.append(len(p))
+            if not d_stat:
+                continue
+            if len(sizes) == 1:
+                quartets = all_quartets(len(pops)) if quartets is None else population_codes(quartets, pops)
+                if d_den_file:
+                    rows = RowFile(d_den_file, len(quartets))
+            den = d_denominator_sums(p, quartets)
+            if rows:
+                rows.append(den)
+            else:
+                d_den.append(den)
+    finally:
+        if rows:
+            rows.close()
+    if not sizes:
+        raise ValueError("No SNPs with observed alleles in every population")
+    return pops, np.stack(f2), np.array(sizes), np.stack(d_den) if d_stat and not rows else None
+
+
+def weighted_jackknife(num: np.ndarray, den: np.ndarray, sizes: np.ndarray):
+    """Estimate and standard error of Σnum / Σden by the weighted block jackknife.
+
+    num and den hold per-block sums (blocks first); blocks are weighted by
+    their SNP counts (Busing et al. 1999). Returns (estimate, stderr).
+    """
+    g = len(sizes)
+    if g < 2:
+        raise ValueError("The block jackknife needs at least two blocks; reduce the block size")
+    shape = (g,) + (1,) * (num.ndim - 1)
+    m = sizes.reshape(shape).astype(np.float64)
+    n = m.sum()
+    h = n / m
+    with np.errstate(invalid='ignore', divide='ignore'):
+        estimate = num.sum(axis=0) / den.sum(axis=0)
+        leave_out = (num.sum(axis=0) - num) / (den.sum(axis=0) - den)
+        jackknife = g * estimate - ((1 - m / n) * leave_out).sum(axis=0)
+        pseudo = h * estimate - (h - 1) * leave_out
+        variance = (((pseudo - jackknife) ** 2) / (h - 1)).mean(axis=0)
+    return estimate, np.sqrt(variance)
+
+
+def f3_table(pops: list, f2: np.ndarray, sizes: np.ndarray, triples: np.ndarray = None,
+             chunk: int = 8192) -> pd.DataFrame:
+    """f3(target; source1, source2) = (f2(T,S1) + f2(T,S2) - f2(S1,S2)) / 2 with jackknife SE and Z.
+
+    Columns match parse_f3_results.
+    """
+    if triples is None:
+        triples = all_triples(len(pops))
+    f3, se = np.empty(len(triples)), np.empty(len(triples))
+    den = np.broadcast_to(sizes[:, None], (len(sizes), 1))
+    for start in range(0, len(triples), chunk):
+        c, a, b = triples[start:start + chunk].T
+        num = (f2[:, c, a] + f2[:, c, b] - f2[:, a, b]) / 2
+        f3[start:start + chunk], se[start:start + chunk] = weighted_jackknife(num, den, sizes)
+    names = np.asarray(pops, dtype=object)
+    df = pd.DataFrame({'target': names[triples[:, 0]], 'source1': names[triples[:, 1]],
+                       'source2': names[triples[:, 2]], 'f3': f3, 'stderr': se})
+    with np.errstate(invalid='ignore', divide='ignore'):
+        df['z_score'] = df['f3'] / df['stderr']
+    df['label'] = df['target'] + ';' + df['source1'] + ',' + df['source2']
+    return df
+
+
+def f4_table(pops: list, f2: np.ndarray, sizes: np.ndarray, quartets: np.ndarray = None,
+             d_den: np.ndarray = None, chunk: int = 8192) -> pd.DataFrame:
+    """f4(A,B;C,D) = (f2(A,D) + f2(B,C) - f2(A,C) - f2(B,D)) / 2 with jackknife SE and Z.
+
+    The f2 noise terms cancel, so the f4 block sums are Σ(a-b)(c-d). When the
+    per-block D denominators of the quartets are given, D = Σ(a-b)(c-d) / Σ(a+b-2ab)(c+d-2cd)
+    is added with its own jackknife.
+    """
+    if quartets is None:
+        quartets = all_quartets(len(pops))
+    n = len(quartets)
+    columns = {name: np.empty(n) for name in ('f4', 'f4_stderr', 'D', 'D_stderr')}
+    den = np.broadcast_to(sizes[:, None], (len(sizes), 1))
+    for start in range(0, n, chunk):
+        a, b, c, d = quartets[start:start + chunk].T
+        num = (f2[:, a, d] + f2[:, b, c] - f2[:, a, c] - f2[:, b, d]) / 2
+        part = slice(start, start + chunk)
+        columns['f4'][part], columns['f4_stderr'][part] = weighted_jackknife(num, den, sizes)
+        if d_den is not None:
+            columns['D'][part], columns['D_stderr'][part] = weighted_jackknife(num, d_den[:, part], sizes)
+
+    names = np.asarray(pops, dtype=object)
+    df = pd.DataFrame({f'pop{i + 1}': names[quartets[:, i]] for i in range(4)})
+    with np.errstate(invalid='ignore', divide='ignore'):
+        df['f4'], df['f4_stderr'] = columns['f4'], columns['f4_stderr']
+        df['f4_z'] = df['f4'] / df['f4_stderr']
+        if d_den is not None:
+            df['D'], df['D_stderr'] = columns['D'], columns['D_stderr']
+            df['D_z'] = df['D'] / df['D_stderr']
+    return df
+
+
+def write_f3(df: pd.DataFrame, filename: str, n_snps: int, n_blocks: int, block_size: int):
+    """Write f3 results in the text layout of TreeMix threepop ("T;S1,S2 f3 stderr Z")."""
+    with open(filename, 'w') as f:
+        f.write(f"total_nsnp {n_snps}\n")
+        f.write(f"Estimating f_3 in {n_blocks} blocks of size {block_size}\n")
+        df[['label', 'f3', 'stderr', 'z_score']].to_csv(f, sep=' ', header=False, index=False,
+                                                         float_format='%.6g')
+
+
+def count_chunks(args, names: list = None):
+    """(pops, a1, total) chunks from the input selected on the command line."""
+    if args.treemix:
+        chunks = read_treemix(args.treemix)
+    elif args.freq:
+        chunks = ((pops, a1, total) for pops, _, a1, total in read_frq_strat(args.freq))
+    else:
+        bed = PlinkBed(args.bfile)
+        print(f"Read {bed.n_samples} samples and {bed.n_snps} SNPs from {args.bfile}", file=sys.stderr)
+        chunks = ((pops, a1, total) for pops, _, a1, total
+                  in genotype_counts(bed, bed.fam['FID'], threads=args.threads))
+    return select_populations(chunks, names)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='f3, f4 and D statistics with block jackknife standard errors')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--treemix', help='TreeMix allele count file (may be gzipped)')
+    source.add_argument('--freq', help='PLINK .frq.strat file (may be gzipped)')
+    source.add_argument('--bfile', help='PLINK fileset prefix; populations are taken from FID')
+    parser.add_argument('--out', default='fstats', help='Output prefix')
+    parser.add_argument('-k', '--block-size', type=int, default=500, help='SNPs per jackknife block')
+    parser.add_argument('--pops', help='Comma-separated populations to test (default: all)')
+    parser.add_argument('--f4', action='store_true', help='Also compute f4 and D for every quartet')
+    parser.add_argument('--tests', help='File of tests to run, one per line: "T;S1,S2" (f3) or "A,B;C,D" (f4 and D)')
+    parser.add_argument('--cache-dir', help='Directory of f2-block caches; reused when one matches the input')
+    parser.add_argument('--threads', type=int, default=None, help='Worker threads with --bfile (default: all cores)')
+    return parser.parse_args()
+
+
+def input_file(args) -> str:
+    return args.treemix or args.freq or f"{args.bfile}.bed"
+
+
+def main():
+    args = parse_args()
+    names = args.pops.split(',') if args.pops else None
+    triples = quartets = None
+    if args.tests:
+        triples, quartets = parse_tests(args.tests)
+        names = names or list(pd.unique(np.concatenate([triples.ravel(), quartets.ravel()])))
+    d_stat = args.f4 or (quartets is not None and len(quartets) > 0)
+
+    path = None
+    if args.cache_dir:
+        signature = source_signature(input_file(args))
+        path = find_cache(args.cache_dir, signature, args.block_size, names, d_stat)
+    if path:
+        print(f"Using f2 cache {path}", file=sys.stderr)
+        pops, f2, sizes, d_den = load_cache(path)
+    elif args.cache_dir:
+        # A cache keeps the D denominators of every quartet, streamed to disk
+        d_den_file = None
+        if d_stat:
+            os.makedirs(args.cache_dir, exist_ok=True)
+            d_den_file = os.path.join(args.cache_dir, f"d_den.{os.getpid()}.npy")
+        pops, f2, sizes, _ = compute_blocks(count_chunks(args, names), args.block_size, d_stat,
+                                            d_den_file=d_den_file)
+        path = write_cache(args.cache_dir, signature, args.block_size, pops, f2, sizes, d_den_file,
+                           complete=names is None)
+        print(f"Saved f2 cache {path}", file=sys.stderr)
+        d_den = load_cache(path)[3]
+    else:
+        # Without a cache only the requested quartets need D denominators
+        pops, f2, sizes, d_den = compute_blocks(count_chunks(args, names), args.block_size, d_stat,
+                                                quartets if args.tests else None)
+    print(f"{len(pops)} populations, {sizes.sum()} SNPs in {len(sizes)} blocks", file=sys.stderr)
+
+    if args.tests:
+        triples, quartets = population_codes(triples, pops), population_codes(quartets, pops)
+    else:
+        selected = population_codes(np.asarray(names or pops, dtype=object), pops)
+        triples = selected[all_triples(len(selected))]
+        quartets = selected[all_quartets(len(selected))] if args.f4 else selected[:0].reshape(0, 4)
+
+    if len(triples):
+        f3 = f3_table(pops, f2, sizes, triples)
+        write_f3(f3, f"{args.out}.f3.txt", sizes.sum(), len(sizes), args.block_size)
+        print(f"Written {len(f3)} f3 tests to {args.out}.f3.txt", file=sys.stderr)
+    if len(quartets):
+        if path and d_den is not None:
+            d_den = d_den[:, quartet_index(quartets, len(pops))]
+        f4 = f4_table(pops, f2, sizes, quartets, d_den)
+        f4.to_csv(f"{args.out}.f4.txt", sep='\t', index=False, float_format='%.6g')
+        print(f"Written {len(f4)} f4/D tests to {args.out}.f4.txt", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,102 +1,44 @@
 #!/usr/bin/env python3
 
+import os
 import sys
-import gzip
 import argparse
+from allele_counts import PlinkBed, read_frq_strat, genotype_counts, write_treemix
 
-def parse_args():
-	parser = argparse.ArgumentParser(description='Convert PLINK .frq.strat file to TreeMix format')
-	parser.add_argument('--freq', required=True, help='PLINK .frq.strat file')
-	parser.add_argument('--out', required=True, help='Output filename (will be gzipped)')
-	return parser.parse_args()
 
-def read_freq_file(filename):
-	"""Read PLINK .frq.strat file and return population data"""
-	pops = set()
-	snp_data = {}
-    
-	with open(filename) as f:
-    	# Skip header line
-    	header = f.readline()
-   	 
-    	# Process each line
-    	for line in f:
-        	fields = line.strip().split()
-        	if len(fields) < 8:  # We need at least 8 fields
-            	continue
-       	 
-        	try:
-            	# Extract fields
-            	snp = fields[1]
-            	pop = fields[2]
-            	mac = int(fields[6])   	# Minor allele count
-            	nchrobs = int(fields[7])   # Number of chromosomes observed
-           	 
-            	# Calculate major allele count
-            	mac_other = nchrobs - mac
-           	 
-            	# Add population to set
-            	pops.add(pop)
-           	 
-            	# Store counts for this SNP and population
-            	if snp not in snp_data:
-                	snp_data[snp] = {}
-           	 
-            	if nchrobs > 0:
-                	snp_data[snp][pop] = f"{mac_other},{mac}"
-            	else:
-                	snp_data[snp][pop] = "0,0"
-               	 
-        	except (ValueError, IndexError) as e:
-            	print(f"Warning: Skipping line due to format error: {line.strip()}", file=sys.stderr)
-            	continue
-    
-	return sorted(list(pops)), snp_data
+def parse_args():
+    parser = argparse.ArgumentParser(description='Convert PLINK .frq.strat file to TreeMix format')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--freq', help='PLINK .frq.strat file (may be gzipped)')
+    source.add_argument('--bfile', help='PLINK fileset prefix; counts are computed per FID as with --freq --family')
+    parser.add_argument('--out', required=True, help='Output filename (will be gzipped)')
+    parser.add_argument('--chunk-size', type=int, default=1_000_000, help='.frq.strat lines read at a time')
+    parser.add_argument('--block-size', type=int, default=4096, help='SNPs per block with --bfile')
+    parser.add_argument('--threads', type=int, default=None, help='Worker threads with --bfile (default: all cores)')
+    return parser.parse_args()
 
-def write_treemix(pops, snp_data, outfile):
-	"""Write data in TreeMix format"""
-	with gzip.open(outfile, 'wt') as f:
-    	# Write header
-    	f.write(' '.join(pops) + '\n')
-   	 
-    	# Write SNP data
-    	valid_snps = 0
-    	total_snps = 0
-    	for snp in snp_data:
-        	total_snps += 1
-        	line = []
-        	valid = True
-       	 
-        	# Check if we have data for all populations
-        	for pop in pops:
-            	if pop not in snp_data[snp]:
-                	valid = False
-                	break
-            	counts = snp_data[snp][pop].split(',')
-            	if sum(int(x) for x in counts) == 0:
-                	valid = False
-                	break
-            	line.append(snp_data[snp][pop])
-       	 
-        	# Write line if valid
-        	if valid:
-            	f.write(' '.join(line) + '\n')
-            	valid_snps += 1
-   	 
-    	print(f"Written {valid_snps} valid SNPs out of {total_snps} total SNPs", file=sys.stderr)
 
 def main():
-	args = parse_args()
-    
-	print("Reading frequency file...", file=sys.stderr)
-	pops, snp_data = read_freq_file(args.freq)
-    
-	print(f"Found {len(pops)} populations:", file=sys.stderr)
-	print(', '.join(pops), file=sys.stderr)
-    
-	print("\nWriting TreeMix file...", file=sys.stderr)
-	write_treemix(pops, snp_data, args.out)
-	print("\nConversion complete!", file=sys.stderr)
+    args = parse_args()
+
+    if args.freq:
+        if not os.path.exists(args.freq):
+            sys.exit(f"Error: {args.freq} not found")
+        print("Streaming frequency file...", file=sys.stderr)
+        chunks = read_frq_strat(args.freq, args.chunk_size)
+    else:
+        bed = PlinkBed(args.bfile)
+        print(f"Counting alleles of {bed.n_snps} SNPs in {bed.n_samples} samples...", file=sys.stderr)
+        chunks = genotype_counts(bed, bed.fam['FID'], args.block_size, args.threads)
+
+    pops, valid_snps, total_snps = write_treemix(chunks, args.out)
+    if pops is None:
+        sys.exit("Error: no SNPs found in input")
+    print(f"Found {len(pops)} populations:", file=sys.stderr)
+    print(', '.join(pops), file=sys.stderr)
+    print(f"Written {valid_snps} valid SNPs out of {total_snps} total SNPs", file=sys.stderr)
+    print("\nConversion complete!", file=sys.stderr)
+
 
 if __name__ == "__main__":
-	main()
+    main()
@@ -1,103 +1,166 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 
 def parse_f3_results(file_path):
-	"""Parse f3 statistics results file into a pandas DataFrame."""
-	data = []
-	with open(file_path, 'r') as f:
-    	for line in f:
-        	if ';' in line:  # Only process lines containing f3 results
-            	parts = line.strip().split()
-            	populations = parts[0].split(';')
-            	target = populations[0]
-            	source1, source2 = populations[1].split(',')
-            	f3_stat = float(parts[1])
-            	std_err = float(parts[2])
-            	z_score = float(parts[3])
-           	 
-            	data.append({
-                	'target': target,
-                	'source1': source1,
-                	'source2': source2,
-                	'f3': f3_stat,
-                	'stderr': std_err,
-                	'z_score': z_score,
-                	'label': f"{target};{source1},{source2}"
-            	})
-    
-	return pd.DataFrame(data)
-
-def plot_f3_statistics_centered(df, output_file=None, figsize=(12, 20)):
-	"""Create a horizontal bar plot of f3 statistics with centered y-axis."""
-	# Sort by absolute Z-score
-	df['abs_z'] = abs(df['z_score'])
-	df_sorted = df.sort_values('abs_z', ascending=True)
-    
-	# Create figure
-	fig, ax = plt.subplots(figsize=figsize)
-    
-	# Create color palette based on z-score signs
-	colors = ['#FF7F7F' if z < 0 else '#66C2A5' for z in df_sorted['z_score']]
-    
-	# Create horizontal bar plot
-	bars = ax.barh(range(len(df_sorted)),
-              	df_sorted['f3'],
-              	xerr=df_sorted['stderr'],
-              	color=colors,
-              	capsize=3)
-    
-	# Find the maximum absolute value for x-axis symmetry
-	max_abs_x = max(abs(df_sorted['f3'].max()), abs(df_sorted['f3'].min()))
-	plt.xlim(-max_abs_x * 1.2, max_abs_x * 1.2)
-    
-	# Add vertical line at x=0
-	ax.axvline(x=0, color='black', linestyle='-', linewidth=0.5)
-    
-	# Remove y-axis labels initially
-	ax.set_yticks([])
-    
-	# Add labels and Z-scores at the end of bars
-	for idx, row in enumerate(df_sorted.itertuples()):
-    	# Determine text color and position based on f3 value
-    	if row.f3 < 0:
-        	x_pos = row.f3 - row.stderr * 1.5
-        	ha = 'right'
-    	else:
-        	x_pos = row.f3 + row.stderr * 1.5
-        	ha = 'left'
-       	 
-    	# Add population labels
-    	ax.text(0, idx, row.label,
-            	ha='center', va='center',
-            	bbox=dict(facecolor='white', edgecolor='none', alpha=0.7))
-   	 
-    	# Add Z-score
-    	ax.text(x_pos, idx, f'Z: {row.z_score:.2f}',
-            	ha=ha, va='center',
-            	bbox=dict(facecolor='white', edgecolor='none', alpha=0.7))
-    
-	# Customize plot
-	ax.set_xlabel('Three population statistics (f3)')
-	ax.set_title('Three population tests')
-    
-	# Add gridlines
-	ax.grid(True, axis='x', linestyle='--', alpha=0.3)
-    
-	# Adjust layout
-	plt.tight_layout()
-    
-	# Save if output file is specified
-	if output_file:
-    	plt.savefig(output_file, dpi=300, bbox_inches='tight')
-   	 
-	return fig
+    """Parse f3 statistics results file into a pandas DataFrame.
+
+    Lines of "target;source1,source2 f3 stderr Z" are read column-wise in one
+    call. Only lines whose first field is a target;source1,source2 triple and
+    whose three values are numbers are kept; headers, block information and
+    other text are dropped.
+    """
+    df = pd.read_csv(file_path, sep=r'\s+', header=None, dtype={'label': str}, on_bad_lines='skip',
+                     names=['label', 'f3', 'stderr', 'z_score'])
+    populations = df['label'].str.extract(r'^([^;,]+);([^;,]+),([^;,]+)$')
+    populations.columns = ['target', 'source1', 'source2']
+    df = pd.concat([populations, df], axis=1)
+    for column in ('f3', 'stderr', 'z_score'):
+        df[column] = pd.to_numeric(df[column], errors='coerce').astype(float)
+    df = df.dropna().reset_index(drop=True)
+    return df[['target', 'source1', 'source2', 'f3', 'stderr', 'z_score', 'label']]
+
+def select_f3_tests(df, top=None, targets=None):
+    """Restrict results to the given target populations and/or the top N tests by |Z|."""
+    if targets:
+        df = df[df['target'].isin(targets)]
+    if top and top < len(df):
+        abs_z = np.abs(df['z_score'].to_numpy())
+        # NaN Z-scores sort last
+        abs_z = np.where(np.isnan(abs_z), -np.inf, abs_z)
+        df = df.iloc[np.argpartition(-abs_z, top - 1)[:top]]
+    return df.reset_index(drop=True)
+
+def plot_f3_statistics_centered(df, output_file=None, figsize=None, title='Three population tests'):
+    """Create a horizontal bar plot of f3 statistics with centered y-axis.
+
+    Without figsize the height grows with the number of tests.
+    """
+    if figsize is None:
+        figsize = (12, max(4, 0.3 * len(df) + 1))
+    # Sort by absolute Z-score
+    df = df.copy()
+    df['abs_z'] = abs(df['z_score'])
+    df_sorted = df.sort_values('abs_z', ascending=True)
+
+    # Create figure
+    fig, ax = plt.subplots(figsize=figsize)
+
+    # Create color palette based on z-score signs
+    colors = ['#FF7F7F' if z < 0 else '#66C2A5' for z in df_sorted['z_score']]
+
+    # Create horizontal bar plot
+    bars = ax.barh(range(len(df_sorted)),
+                df_sorted['f3'],
+                xerr=df_sorted['stderr'],
+                color=colors,
+                capsize=3)
+
+    # Find the maximum absolute value for x-axis symmetry
+    max_abs_x = max(abs(df_sorted['f3'].max()), abs(df_sorted['f3'].min()))
+    plt.xlim(-max_abs_x * 1.2, max_abs_x * 1.2)
+
+    # Add vertical line at x=0
+    ax.axvline(x=0, color='black', linestyle='-', linewidth=0.5)
+
+    # Remove y-axis labels initially
+    ax.set_yticks([])
+
+    # Add labels and Z-scores at the end of bars
+    for idx, row in enumerate(df_sorted.itertuples()):
+        # Determine text color and position based on f3 value
+        if row.f3 < 0:
+            x_pos = row.f3 - row.stderr * 1.5
+            ha = 'right'
+        else:
+            x_pos = row.f3 + row.stderr * 1.5
+            ha = 'left'
+
+        # Add population labels
+        ax.text(0, idx, row.label,
+                ha='center', va='center',
+                bbox=dict(facecolor='white', edgecolor='none', alpha=0.7))
+
+        # Add Z-score
+        ax.text(x_pos, idx, f'Z: {row.z_score:.2f}',
+                ha=ha, va='center',
+                bbox=dict(facecolor='white', edgecolor='none', alpha=0.7))
+
+    # Customize plot
+    ax.set_xlabel('Three population statistics (f3)')
+    ax.set_title(title)
+
+    # Add gridlines
+    ax.grid(True, axis='x', linestyle='--', alpha=0.3)
+
+    # Adjust layout
+    plt.tight_layout()
+
+    # Save if output file is specified
+    if output_file:
+        plt.savefig(output_file, dpi=300, bbox_inches='tight')
+
+    return fig
+
+def _render_page(page, output_file, title):
+    """Process pool task: draw and save one figure."""
+    import matplotlib
+    matplotlib.use('Agg')
+    fig = plot_f3_statistics_centered(page, output_file=output_file, title=title)
+    plt.close(fig)
+    return output_file
+
+def _pages(df, prefix, per_page, title):
+    """(path, rows, title) pages of per_page tests, strongest |Z| first."""
+    order = np.argsort(-np.abs(df['z_score'].to_numpy()), kind='stable')
+    ordered = df.iloc[order]
+    n_pages = max(1, -(-len(ordered) // per_page))
+    return [(f"{prefix}_page{i + 1:03d}.png", ordered.iloc[i * per_page:(i + 1) * per_page],
+             f'{title} ({i + 1}/{n_pages})') for i in range(n_pages)]
+
+def plot_f3_pages(df, out_prefix, per_page=60, by_target=False, workers=None):
+    """Split results into pages (strongest |Z| first), per target if requested, and render them in parallel.
+
+    Returns the list of written files.
+    """
+    if by_target:
+        groups = [page for target, group in df.groupby('target', sort=True)
+                  for page in _pages(group, f"{out_prefix}_{target}", per_page,
+                                     f'Three population tests: {target}')]
+    else:
+        groups = _pages(df, out_prefix, per_page, 'Three population tests')
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_render_page, page, path, title) for path, page, title in groups]
+        return [future.result() for future in futures]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Plot f3 statistics from threepop or fstats.py output')
+    parser.add_argument('--input', default='f3_results.txt', help='f3 results file')
+    parser.add_argument('--out', default='f3_statistics_centered', help='Output prefix for PNG files')
+    parser.add_argument('--top', type=int, default=None, help='Plot only the N tests with the largest |Z|')
+    parser.add_argument('--target', default=None, help='Comma-separated target populations to plot')
+    parser.add_argument('--by-target', action='store_true', help='Separate pages for each target population')
+    parser.add_argument('--per-page', type=int, default=60, help='Tests per figure when paginating')
+    parser.add_argument('--workers', type=int, default=None, help='Parallel plotting processes (default: all cores)')
+    return parser.parse_args()
 
 # Example usage
 if __name__ == "__main__":
-	# Read and parse the f3 results
-	df = parse_f3_results('f3_results.txt')
-    
-	# Create the plot and save it
-	plot_f3_statistics_centered(df, output_file='f3_statistics_centered.png')
+    args = parse_args()
+
+    # Read and parse the f3 results
+    df = parse_f3_results(args.input)
+    df = select_f3_tests(df, args.top, args.target.split(',') if args.target else None)
+    print(f"Plotting {len(df)} f3 tests")
+
+    # Small result sets fit one figure; larger ones are split
+    if not args.by_target and len(df) <= args.per_page:
+        plot_f3_statistics_centered(df, output_file=f"{args.out}.png")
+        print(f"Saved {args.out}.png")
+    else:
+        files = plot_f3_pages(df, args.out, args.per_page, args.by_target, args.workers)
+        print(f"Saved {len(files)} figures with prefix {args.out}")